@@ -0,0 +1,180 @@
+"""Asset build step for Liquid Rigidity.
+
+Checks every asset the game references (weapon sounds, level music and the
+images it loads), then writes a build/ directory the game loads from:
+
+- weapon sounds are decoded once here and stored as WAV in the mixer's own
+  format, so loading one at run time is a copy instead of an MP3 decode
+- music is streamed while it plays, so it is copied as it is
+- files are stored once per content hash, so duplicates share one file
+
+build/manifest.json maps each source path to its built file. The game falls
+back to the source file for anything not in the manifest, or whose source
+changed since the build.
+
+    python assets.py check     # report missing, duplicate and unreferenced assets
+    python assets.py build     # check, then write build/ and its manifest
+    python assets.py clean     # delete build/
+"""
+import io
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import hashlib
+import argparse
+
+os.environ["LRP_HEADLESS"] = "1"
+os.environ["LRP_ASSETS"] = "source"  # Time and read the sources, not an earlier build
+
+import pygame
+import game
+
+BUILD_DIR = os.path.dirname(game.ASSET_MANIFEST)
+ASSET_EXTENSIONS = (".mp3", ".wav", ".ogg", ".jpg", ".jpeg", ".png")
+SKIP_DIRS = {"build", ".cache", "profiles", "__pycache__"}
+
+def source_path(path):
+    return os.path.join(game.GAME_DIR, path)
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def references():
+    """Return (path, kind, used by) for every asset the game loads."""
+    found = []
+    for name, path in game.weapon_sounds.files.items():
+        found.append((path, "sound", f"weapon_sounds[{name!r}]"))
+    for level, path in game.level_music.items():
+        found.append((path, "music", f"level_music[{level!r}]"))
+    for path in game.image_files:
+        found.append((path, "image", "image_files"))
+    return found
+
+def asset_files():
+    """Every asset-like file shipped next to the game, relative to GAME_DIR."""
+    files = []
+    for root, dirs, names in os.walk(game.GAME_DIR):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS)
+        for name in sorted(names):
+            if name.lower().endswith(ASSET_EXTENSIONS):
+                path = os.path.join(root, name)
+                files.append(os.path.relpath(path, game.GAME_DIR).replace(os.sep, "/"))
+    return files
+
+def check():
+    """Print what is missing, duplicated and unused. Returns the missing paths."""
+    refs = references()
+    missing = [(path, used_by) for path, _, used_by in refs if not os.path.exists(source_path(path))]
+    referenced = {path for path, _, _ in refs}
+    shipped = asset_files()
+
+    by_hash = {}
+    for path in shipped:
+        by_hash.setdefault(file_hash(source_path(path)), []).append(path)
+    duplicates = [paths for paths in by_hash.values() if len(paths) > 1]
+    unused = [path for path in shipped if path not in referenced]
+
+    print(f"{len(refs)} references, {len(shipped)} asset files")
+    for path, used_by in missing:
+        print(f"  missing     {path}  ({used_by})")
+    for paths in duplicates:
+        print(f"  duplicates  {', '.join(paths)}")
+    for path in unused:
+        print(f"  unused      {path}")
+    return [path for path, _ in missing]
+
+def transcode(path):
+    """Decode a sound with the mixer and return it as WAV bytes in the mixer's format."""
+    game.init_audio()
+    frequency, size, channels = pygame.mixer.get_init()
+    samples = pygame.mixer.Sound(path).get_raw()
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(abs(size) // 8)
+        out.setframerate(frequency)
+        out.writeframes(samples)
+    return buffer.getvalue()
+
+def store(data, extension):
+    """Write data under its content hash and return its path relative to GAME_DIR."""
+    name = hashlib.sha1(data).hexdigest()[:16] + extension
+    path = os.path.join(BUILD_DIR, name)
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(data)
+    return os.path.relpath(path, game.GAME_DIR).replace(os.sep, "/")
+
+def build():
+    missing = check()
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    files = {}
+    built = {}  # Source content hash -> built file, so duplicates are only processed once
+    for path, kind, _ in references():
+        source = source_path(path)
+        if path in missing or path in files:
+            continue
+        with open(source, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        key = (digest, kind)
+        if key not in built:
+            if kind == "sound":
+                built[key] = store(transcode(source), ".wav")
+            else:
+                built[key] = store(data, os.path.splitext(path)[1].lower())
+        stat = os.stat(source)
+        files[path] = {"file": built[key], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    # Drop files left over from earlier builds
+    keep = {os.path.basename(entry["file"]) for entry in files.values()}
+    for name in os.listdir(BUILD_DIR):
+        if name not in keep and name != os.path.basename(game.ASSET_MANIFEST):
+            os.remove(os.path.join(BUILD_DIR, name))
+
+    with open(game.ASSET_MANIFEST, "w") as f:
+        json.dump({"version": 1, "files": files, "missing": missing}, f, indent=2)
+
+    shipped = sum(os.path.getsize(source_path(path)) for path in asset_files())
+    output = sum(os.path.getsize(os.path.join(BUILD_DIR, name)) for name in keep)
+    print(f"built {len(files)} references into {len(keep)} files: "
+          f"{output / 1024:.0f} KiB (shipped assets: {shipped / 1024:.0f} KiB)")
+    report_load_times(files)
+    return missing
+
+def report_load_times(files):
+    """Compare decoding the weapon sounds from their sources and from the build."""
+    sounds = [path for path in game.weapon_sounds.files.values() if path in files]
+    if not sounds:
+        return
+    game.init_audio()
+    for label, paths in (("source", [source_path(p) for p in sounds]),
+                         ("built", [source_path(files[p]["file"]) for p in sounds])):
+        start = time.perf_counter()
+        for path in paths:
+            pygame.mixer.Sound(path)
+        print(f"  weapon sounds from {label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+def clean():
+    if os.path.isdir(BUILD_DIR):
+        shutil.rmtree(BUILD_DIR)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and build the game's assets")
+    parser.add_argument("command", choices=["check", "build", "clean"])
+    parser.add_argument("--strict", action="store_true", help="fail if a referenced asset is missing")
+    args = parser.parse_args()
+
+    if args.command == "clean":
+        clean()
+        return
+    missing = check() if args.command == "check" else build()
+    if missing and (args.strict or args.command == "check"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
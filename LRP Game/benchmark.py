@@ -0,0 +1,158 @@
+"""Frame-time benchmarks for the Liquid Rigidity levels.
+
+Each benchmark drives a level (or the map world) with a scripted key and
+mouse sequence for a fixed number of frames, with the frame rate uncapped,
+and reports p50/p95/p99 frame, update and draw times.
+
+    python benchmark.py                                # every benchmark, console table
+    python benchmark.py --frames 3000 --json bench.json
+    python benchmark.py --benchmarks level1 level1-bullets --window
+
+By default the game runs headless (SDL dummy drivers). --window opens a real
+window so the numbers include the display driver of the machine under test.
+"""
+import os
+import sys
+import json
+import argparse
+import contextlib
+
+if "--window" not in sys.argv:
+    os.environ["LRP_HEADLESS"] = "1"
+
+import pygame
+import game
+
+FRAME_BUDGET_MS = 1000 / 60
+
+def hold(keys, frames, mouse_pos=(400, 300), clicks=()):
+    """Script frames holding the given keys."""
+    state = game.KeyState(keys)
+    return [(state, mouse_pos, clicks)] * frames
+
+def patrol(*moves):
+    """Script a sequence of (keys, frames) moves."""
+    script = []
+    for keys, frames in moves:
+        script.extend(hold(keys, frames))
+    return script
+
+def shooting(moves, clicks_per_frame=1, every=1, targets=((100, 100), (700, 100), (700, 500), (100, 500))):
+    """Add mouse clicks to a movement script, cycling the mouse over a few targets."""
+    script = []
+    for frame, (keys, _, _) in enumerate(moves):
+        mouse_pos = targets[(frame // every) % len(targets)]
+        clicks = (1,) * clicks_per_frame if frame % every == 0 else ()
+        script.append((keys, mouse_pos, clicks))
+    return script
+
+# Movement patterns
+STRAFE = patrol(([pygame.K_a], 60), ([pygame.K_d], 120), ([pygame.K_a], 60))
+BOX = patrol(([pygame.K_w], 40), ([pygame.K_d], 60), ([pygame.K_s], 40), ([pygame.K_a], 60))
+MAZE_WALK = patrol(([pygame.K_d], 80), ([pygame.K_w], 40), ([pygame.K_d], 80), ([pygame.K_s], 60),
+                   ([pygame.K_a], 80), ([pygame.K_w], 20))
+
+# name: (level, input script, settings overrides)
+BENCHMARKS = {
+    "map": ("map", STRAFE, {}),
+    "level1": ("level1", shooting(STRAFE, every=10), {}),
+    "level1-bullets": ("level1", shooting(STRAFE, clicks_per_frame=12), {"level1_enemies": 200}),
+    "level2": ("level2", BOX, {}),
+    "level2-obstacles": ("level2", BOX, {"level2_obstacles": 50}),
+    "level3": ("level3", BOX, {}),
+    "level3-crowd": ("level3", BOX, {"level3_animals": 300, "level3_enemies": 100}),
+    "level4": ("level4", MAZE_WALK, {}),
+    "level4-horde": ("level4", MAZE_WALK, {"level4_enemies": 500, "endless": True}),
+    "level5": ("level5", shooting(STRAFE, every=6, targets=((400, 300),)), {}),
+    "level6": ("level6", STRAFE, {}),
+    "level2-stress": ("level2-stress", BOX, {}),
+    "level6-endless": ("level6-endless", STRAFE, {}),
+    "level4-maze": ("level4-maze", MAZE_WALK, {}),
+    "level4-huge": ("level4-huge", MAZE_WALK, {}),
+}
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+# Benchmark columns made of the FrameTimer phases
+PHASE_GROUPS = {
+    "total": ("total",),
+    "update": ("events", "player", "groups", "collisions"),
+    "draw": ("draw", "flip"),
+}
+
+def summarize(frames):
+    summary = {"frames": len(frames)}
+    for phase, parts in PHASE_GROUPS.items():
+        values = [sum(frame.get(part, 0.0) for part in parts) * 1000 for frame in frames]
+        for pct in (50, 95, 99):
+            summary[f"{phase}_p{pct}_ms"] = round(percentile(values, pct), 3)
+    summary["over_budget"] = sum(1 for frame in frames if frame["total"] * 1000 > FRAME_BUDGET_MS)
+    return summary
+
+def run_benchmark(name, frames, seed=0):
+    """Run one benchmark for a number of frames and return its timing summary.
+
+    A level that finishes early (won or lost) is restarted with the next seed
+    until enough frames have been measured.
+    """
+    level, script, overrides = BENCHMARKS[name]
+    saved_settings = dict(game.settings)
+    game.settings.update(overrides)
+    game.controls = game.ScriptedInput(script)
+    ring_buffer = game.frame_timer.frames
+    measured = game.frame_timer.frames = []  # Keep every frame, not just the last few
+    game.frame_timer.enabled = True
+    game.clock.virtual = True  # Uncapped frames, intros don't wait for clicks
+    runs = 0
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            while len(measured) < frames:
+                game.simulate(level, f"{seed}-{runs}", max_frames=frames - len(measured))
+                runs += 1
+    finally:
+        game.frame_timer.frames = ring_buffer
+        game.frame_timer.enabled = game.frame_timer.csv_path is not None
+        game.controls = game.LiveInput()
+        game.settings.clear()
+        game.settings.update(saved_settings)
+    summary = summarize(measured[:frames])
+    summary["runs"] = runs
+    return summary
+
+def print_table(results):
+    columns = ["frame p50", "p95", "p99", "update p50", "p95", "p99", "draw p50", "p95", "p99", "over"]
+    print(f"{'benchmark':<18}" + "".join(f"{column:>11}" for column in columns))
+    for name, summary in results.items():
+        values = [summary[f"{phase}_p{pct}_ms"] for phase in ("total", "update", "draw") for pct in (50, 95, 99)]
+        print(f"{name:<18}" + "".join(f"{value:>11.3f}" for value in values) + f"{summary['over_budget']:>11}")
+    print(f"(milliseconds; 'over' counts frames above the {FRAME_BUDGET_MS:.1f} ms budget)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-level frame-time benchmarks")
+    parser.add_argument("--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument("--frames", type=int, default=1000, help="measured frames per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    parser.add_argument("--window", action="store_true", help="render to a real window instead of headless")
+    args = parser.parse_args()
+
+    results = {name: run_benchmark(name, args.frames, args.seed) for name in args.benchmarks}
+    print_table(results)
+    if args.json:
+        report = {
+            "frames": args.frames,
+            "seed": args.seed,
+            "budget_ms": FRAME_BUDGET_MS,
+            "renderer": "dirty" if game.renderer.dirty else "full",
+            "results": results,
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
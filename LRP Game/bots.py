@@ -0,0 +1,299 @@
+"""Scripted bots and a parallel batch runner for tuning level difficulty.
+
+Each level has a simple bot policy that looks at what the level exposes in
+game.scene and decides which keys to hold, where to point the mouse and
+when to click. The batch runner plays many seeded runs of a level per
+parameter set across a process pool, headless and uncapped, and reports
+win rate, time to clear and what ended the runs that failed.
+
+    python bots.py --levels level2 --runs 1000 --set "level2_obstacles=3|5|8"
+    python bots.py --levels level5 --set "level5_flame_growth=0.5|1" --set "level5_flame_shrink=5|10"
+    python bots.py --levels level6 --set "level6_max_missed=5|10" --json level6.json
+    python bots.py --levels level4 --set "level4_maze_size=[40, 30]|[80, 60]"
+
+A --set value is JSON, or several JSON values separated by | to try each
+of them (a JSON list is one value, for settings like level4_maze_size).
+Every combination of the --set values is one parameter set. Run i of every
+parameter set uses the same seed, so the sets are compared on the same
+games.
+"""
+import os
+import sys
+import json
+import time
+import math
+import argparse
+import itertools
+import contextlib
+import statistics
+import multiprocessing
+from collections import Counter
+
+os.environ["LRP_HEADLESS"] = "1"
+
+import pygame
+import game
+
+CLICKS_PER_SECOND = 8  # About as fast as a person keeps clicking
+
+def centers(group):
+    """Centers of the sprites in a sprite group or an array-backed swarm."""
+    if hasattr(group, "pos"):
+        return [(x + group.width / 2, y + group.height / 2) for x, y in group.pos[:group.count].tolist()]
+    return [sprite.rect.center for sprite in group]
+
+def nearest(position, points):
+    return min(points, key=lambda point: math.dist(position, point), default=None)
+
+def toward(position, target, dead_zone=0):
+    """WASD keys that move from position toward target."""
+    keys = []
+    dx, dy = target[0] - position[0], target[1] - position[1]
+    if dx < -dead_zone:
+        keys.append(pygame.K_a)
+    elif dx > dead_zone:
+        keys.append(pygame.K_d)
+    if dy < -dead_zone:
+        keys.append(pygame.K_w)
+    elif dy > dead_zone:
+        keys.append(pygame.K_s)
+    return keys
+
+def clicking(frame):
+    """Whether a bot clicking at CLICKS_PER_SECOND clicks this frame."""
+    return frame % max(round((game.RENDER_FPS or game.SIM_RATE) / CLICKS_PER_SECOND), 1) == 0
+
+def shoot_at(player, target, frame):
+    """Mouse position and clicks for firing at a target."""
+    if target is None or tuple(target) == player.rect.center:
+        return player.rect.center, ()
+    return target, (1,) if clicking(frame) else ()
+
+def level1_bot(scene, frame, state):
+    """Stand still and shoot at the nearest enemy."""
+    player = scene["player"]
+    mouse_pos, clicks = shoot_at(player, nearest(player.rect.center, centers(scene["enemies"])), frame)
+    return (), mouse_pos, clicks
+
+def level2_bot(scene, frame, state):
+    """Head for the nearest brain, backing away from any obstacle that comes close."""
+    player = scene["player"]
+    position = player.rect.center
+    threat = nearest(position, centers(scene["obstacles"]))
+    if threat is not None and math.dist(position, threat) < 90:
+        away = (2 * position[0] - threat[0], 2 * position[1] - threat[1])
+        return toward(position, away), position, ()
+    brain = nearest(position, [sprite.rect.center for sprite in scene["brains"]])
+    return (toward(position, brain, player.speed) if brain else ()), position, ()
+
+def level3_bot(scene, frame, state):
+    """Get behind the nearest animal and push it toward the safe zone."""
+    player = scene["player"]
+    position = player.rect.center
+    animal = nearest(position, [sprite.rect.center for sprite in scene["animals"]])
+    if animal is None:
+        return (), position, ()
+    goal = scene["safe_zone"].center
+    distance = math.dist(animal, goal) or 1
+    behind = (animal[0] - (goal[0] - animal[0]) * 45 / distance, animal[1] - (goal[1] - animal[1]) * 45 / distance)
+    if math.dist(position, behind) > 15:
+        return toward(position, behind, player.speed), position, ()
+    return toward(position, goal, player.speed), position, ()
+
+def level4_bot(scene, frame, state):
+    """Follow a flow field to the 7-Eleven, keeping lined up with the tiles."""
+    player, grid, goal = scene["player"], scene["walls"], scene["seven_eleven"]
+    if state.get("grid") is not grid:
+        state["grid"] = grid
+        state["flow"] = game.FlowField(grid)
+        state["flow"].update(*grid.tile_at(goal.center))
+    column, row = grid.tile_at(player.rect.center)
+    step_x, step_y = state["flow"].step(column, row)
+    size = grid.tile_size
+    target = ((column + step_x) * size + size // 2, (row + step_y) * size + size // 2)
+    return toward(player.rect.center, target, player.speed // 2), player.rect.center, ()
+
+def level5_bot(scene, frame, state):
+    """Stand still and hose the flame."""
+    player = scene["player"]
+    mouse_pos, clicks = shoot_at(player, scene["flame"].rect.center, frame)
+    return (), mouse_pos, clicks
+
+def level6_bot(scene, frame, state):
+    """Catch the lowest data point still above the player, dodging glitches about to land."""
+    player = scene["player"]
+    x, top = player.rect.centerx, player.rect.top
+    landing = [glitch_x for glitch_x, glitch_y in centers(scene["glitches"])
+               if top - 160 < glitch_y < player.rect.bottom + 15]
+    threat = nearest((x, 0), [(glitch_x, 0) for glitch_x in landing if abs(glitch_x - x) < 60])
+    if threat is not None:
+        left = threat[0] > x
+        if player.rect.x <= 50 or player.rect.x >= game.SCREEN_WIDTH - 50:  # Against an edge, go the other way
+            left = player.rect.x > 50
+        return ([pygame.K_a] if left else [pygame.K_d]), player.rect.center, ()
+    falling = [point for point in centers(scene["data_points"])
+               if point[1] < top and all(abs(point[0] - glitch_x) > 60 for glitch_x in landing)]
+    if not falling:
+        return (), player.rect.center, ()
+    target_x = max(falling, key=lambda point: point[1])[0]
+    return toward((x, 0), (target_x, 0), player.speed), player.rect.center, ()
+
+POLICIES = {
+    "level1": level1_bot,
+    "level2": level2_bot,
+    "level3": level3_bot,
+    "level4": level4_bot,
+    "level5": level5_bot,
+    "level6": level6_bot,
+}
+
+def policy_for(level):
+    """The bot for a level or one of its variants (level2-stress plays like level2)."""
+    return POLICIES[level.split("-")[0]]
+
+class BotInput:
+    """Input source driven by a bot policy instead of the keyboard and mouse.
+
+    Like ScriptedInput, except each frame's (keys, mouse_pos, clicks) come
+    from policy(game.scene, frame, state), where state is a dict the policy
+    may keep things in for the rest of the run.
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.state = {}
+        self.frame = -1
+        self.keys = game.KeyState()
+        self.mouse_pos = (0, 0)
+
+    def events(self):
+        events = [event for event in pygame.event.get() if event.type not in game.USER_INPUT_EVENTS]
+        self.frame += 1
+        keys, self.mouse_pos, clicks = self.policy(game.scene, self.frame, self.state)
+        self.keys = game.KeyState(keys)
+        for button in clicks:
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=button, pos=self.mouse_pos))
+        return events
+
+    def get_pressed(self):
+        return self.keys
+
+    def get_mouse_pos(self):
+        return self.mouse_pos
+
+    def frame_time(self, milliseconds):
+        return milliseconds
+
+def play(task):
+    """Play one seeded bot run; returns (parameter set index, outcome).
+
+    A run that raises counts as "crashed", so one bad parameter set doesn't
+    stop the batch.
+    """
+    index, level, overrides, seed, player_name, max_frames = task
+    game.clock.virtual = True
+    game.controls = BotInput(policy_for(level))
+    game.last_outcome = None
+    try:
+        # The levels print a line for every shot and pickup
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            with game.overridden_settings(**overrides):
+                result, frames, ticks = game.simulate(level, seed, player_name, max_frames)
+    except Exception as error:
+        print(f"{level} {overrides} seed {seed} crashed: {error!r}", file=sys.stderr)
+        return index, {"result": "crashed", "cause": f"crashed ({type(error).__name__})",
+                       "time_ms": None, "frames": game.clock.frames}
+    finally:
+        game.controls = game.LiveInput()
+    outcome = game.last_outcome or {"result": "timeout", "cause": "timeout", "time_ms": None}
+    return index, dict(outcome, frames=frames)
+
+def summarize(outcomes):
+    wins = [outcome for outcome in outcomes if outcome["result"] == "win"]
+    clear_times = [outcome["time_ms"] / 1000 for outcome in wins]
+    summary = {
+        "runs": len(outcomes),
+        "win_rate": round(len(wins) / len(outcomes), 4) if outcomes else 0.0,
+        "clear_s_median": round(statistics.median(clear_times), 2) if clear_times else None,
+        "clear_s_p90": round(sorted(clear_times)[round(0.9 * (len(clear_times) - 1))], 2) if clear_times else None,
+        "causes": dict(Counter(outcome["cause"] for outcome in outcomes).most_common()),
+    }
+    # Averages of whatever else the level recorded, e.g. brains or rescued animals
+    skip = ("result", "cause", "time_ms", "frames")
+    stats = sorted({key for outcome in outcomes for key in outcome if key not in skip})
+    for key in stats:
+        values = [outcome[key] for outcome in outcomes if key in outcome]
+        summary[f"mean_{key}"] = round(sum(values) / len(values), 2)
+    return summary
+
+def parameter_sets(assignments):
+    """Every combination of the --set values, as settings override dicts."""
+    keys, choices = [], []
+    for assignment in assignments:
+        key, _, value = assignment.partition("=")
+        if key not in game.settings:
+            raise SystemExit(f"unknown setting {key!r}; choose from {', '.join(game.settings)}")
+        keys.append(key)
+        choices.append([json.loads(part) for part in value.split("|")])
+    return [dict(zip(keys, combination)) for combination in itertools.product(*choices)]
+
+def run_batch(levels, parameter_sets, runs, seed=0, processes=None, player_name="Daniel", max_frames=60 * 60 * 2):
+    """Play runs seeded games of every level with every parameter set; returns one summary row per pair."""
+    cases = [(level, overrides) for level in levels for overrides in parameter_sets]
+    tasks = [(index, level, overrides, f"{seed}-{run}", player_name, max_frames)
+             for index, (level, overrides) in enumerate(cases) for run in range(runs)]
+    outcomes = [[] for _ in cases]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        results = [play(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = list(pool.imap_unordered(play, tasks, chunksize=max(1, len(tasks) // (processes * 8))))
+            pool.close()  # Let the workers exit on their own; terminate() can leave them hanging
+        except BaseException:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    for index, outcome in results:
+        outcomes[index].append(outcome)
+    return [dict(level=level, settings=overrides, **summarize(outcomes[index]))
+            for index, (level, overrides) in enumerate(cases)]
+
+def print_table(rows):
+    print(f"{'level':<14}{'settings':<40}{'runs':>6}{'win %':>8}{'clear p50':>11}{'p90':>8}  causes")
+    for row in rows:
+        settings = ", ".join(f"{key}={value}" for key, value in row["settings"].items()) or "defaults"
+        clear = lambda value: f"{value:.1f}s" if value is not None else "-"
+        causes = ", ".join(f"{cause} {count}" for cause, count in row["causes"].items())
+        print(f"{row['level']:<14}{settings:<40}{row['runs']:>6}{row['win_rate'] * 100:>7.1f}%"
+              f"{clear(row['clear_s_median']):>11}{clear(row['clear_s_p90']):>8}  {causes}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch bot runs for difficulty tuning")
+    parser.add_argument("--levels", nargs="+", default=list(POLICIES),
+                        choices=[level for level in game.LEVELS if level != "map"])
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=JSON[|JSON...]",
+                        help="setting to override; separate values with | to try each, e.g. level2_obstacles=3|5|8")
+    parser.add_argument("--runs", type=int, default=100, help="seeded runs per level and parameter set")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--player", default="Daniel", choices=list(game.characters))
+    parser.add_argument("--max-frames", type=int, default=60 * 60 * 2, help="frames before a run counts as a timeout")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = run_batch(args.levels, parameter_sets(args.set), args.runs, args.seed, args.processes,
+                     args.player, args.max_frames)
+    elapsed = time.perf_counter() - started
+    print_table(rows)
+    total = sum(row["runs"] for row in rows)
+    print(f"({total} runs in {elapsed:.1f} s, {total / elapsed:.1f} runs/s)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "seed": args.seed, "player": args.player, "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
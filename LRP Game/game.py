@@ -1,10 +1,78 @@
-import pygame
-import random
+import os
 import sys
 import math
+import random
+import argparse
+import time
+import json
+import hashlib
+import contextlib
+import csv
+import atexit
+import functools
+import threading
+import struct
+from array import array
+from collections import OrderedDict, deque
+
+MODULE_START = time.perf_counter()
+
+# Headless mode: no window or sound device, virtual time and uncapped frames
+HEADLESS = os.environ.get("LRP_HEADLESS") == "1"
+if HEADLESS:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
 
-# Initialize pygame
-pygame.init()
+# NumPy is optional and only imported once an array-backed code path wants it
+np = None  # The numpy module once loaded, False if it isn't installed
+
+def numpy_available():
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = False
+    return np is not False
+
+# Assets are looked up next to this file, whatever the working directory is
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Built copies of the assets, written by assets.py. LRP_ASSETS=source ignores them.
+ASSET_MANIFEST = os.path.join(GAME_DIR, "build", "manifest.json")
+asset_manifest = None  # Source path -> manifest entry, read on first use
+
+def load_asset_manifest():
+    if os.environ.get("LRP_ASSETS") == "source":
+        return {}
+    try:
+        with open(ASSET_MANIFEST) as f:
+            return json.load(f)["files"]
+    except (OSError, ValueError, KeyError):
+        return {}  # Not built yet: use the source files
+
+def asset_path(path):
+    """Return the file to load for an asset, preferring its built copy.
+
+    A built copy is only used while its source is unchanged (same size and
+    modification time as when it was built), or if the source is gone.
+    """
+    global asset_manifest
+    if asset_manifest is None:
+        asset_manifest = load_asset_manifest()
+    entry = asset_manifest.get(path)
+    if entry is not None:
+        try:
+            stat = os.stat(os.path.join(GAME_DIR, path))
+            fresh = (stat.st_size, stat.st_mtime_ns) == (entry["size"], entry["mtime_ns"])
+        except OSError:
+            fresh = True
+        if fresh:
+            return os.path.join(GAME_DIR, entry["file"])
+    return os.path.join(GAME_DIR, path)
 
 # Screen dimensions
 SCREEN_WIDTH = 800
@@ -28,24 +96,731 @@ characters = {
     "Hera": {"color": WHITE, "weapon": "bass pulse", "speed": 6}
 }
 
-weapon_sounds = {
-    "Daniel": pygame.mixer.Sound("sounds/daniel_weapon.mp3"),
-    "Rob": pygame.mixer.Sound("sounds/rob_weapon.mp3"),
-    "Pete": pygame.mixer.Sound("sounds/pete_weapon.mp3"),
-    "Seb": pygame.mixer.Sound("sounds/seb_weapon.mp3"),
-    "Hera": pygame.mixer.Sound("sounds/hera_weapon.mp3")
+# Startup timing
+STARTUP_BUDGET_MS = 1000  # Budget for the time to the first interactive frame
+startup_times = {}  # Milestone -> seconds since this module started loading
+
+def mark_startup(milestone):
+    if milestone not in startup_times:
+        startup_times[milestone] = time.perf_counter() - MODULE_START
+
+def startup_report():
+    """Print the startup milestones and return True if the first frame was within budget."""
+    for milestone in ("import", "window", "first_frame"):
+        if milestone in startup_times:
+            print(f"{milestone:<12}{startup_times[milestone] * 1000:9.1f} ms")
+    first_frame = startup_times.get("first_frame", float("inf")) * 1000
+    within_budget = first_frame <= STARTUP_BUDGET_MS
+    print(f"time to first frame {'within' if within_budget else 'OVER'} the {STARTUP_BUDGET_MS} ms budget")
+    return within_budget
+
+# Audio is only initialized, and sounds only decoded, once they are needed
+AUDIO_FREQUENCY = 44100
+AUDIO_BUFFER = int(os.environ.get("LRP_AUDIO_BUFFER", 256))  # Samples per mixer buffer; fewer means less lag
+AUDIO_CATEGORIES = {  # Mixer channels reserved per kind of sound, and what happens when they are all busy
+    "weapon": (8, "steal"),
 }
-
-
-# Screen setup
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-#screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
-#SCREEN_WIDTH, SCREEN_HEIGHT = screen.get_size()
-
-pygame.display.set_caption("Liquid Rigidity")
+AUDIO_FREE_CHANNELS = 8  # Unreserved channels for anything played with Sound.play()
+pygame.mixer.pre_init(AUDIO_FREQUENCY, -16, 2, AUDIO_BUFFER)
+
+def init_audio():
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+
+class AudioEngine:
+    """Plays sound effects on mixer channels reserved per category.
+
+    Each category in AUDIO_CATEGORIES gets its own channels, so a burst of one
+    kind of sound can't use up the channels of another. When all of a
+    category's channels are busy its rule decides: "steal" restarts the
+    channel whose sound started longest ago, so the newest sound is always
+    heard, and "drop" skips the new sound. stats counts plays, steals and
+    drops.
+    """
+
+    def __init__(self, categories):
+        self.categories = categories
+        self.pools = None  # Category: channels, least recently started first
+        self.stats = {"plays": 0, "steals": 0, "drops": 0}
+
+    def start(self):
+        if HEADLESS:
+            return  # Nobody is listening
+        init_audio()
+        if self.pools is not None:
+            return
+        reserved = sum(count for count, rule in self.categories.values())
+        pygame.mixer.set_num_channels(reserved + AUDIO_FREE_CHANNELS)
+        pygame.mixer.set_reserved(reserved)
+        self.pools = {}
+        first = 0
+        for category, (count, rule) in self.categories.items():
+            self.pools[category] = deque(pygame.mixer.Channel(index) for index in range(first, first + count))
+            first += count
+
+    def play(self, sound, category):
+        """Play a sound on one of the category's channels; returns the channel, or None if it was dropped."""
+        if HEADLESS:
+            return None  # Don't start the mixer just to play to nobody
+        self.start()
+        pool = self.pools[category]
+        channel = next((channel for channel in pool if not channel.get_busy()), None)
+        if channel is None:
+            if self.categories[category][1] == "drop":
+                self.stats["drops"] += 1
+                return None
+            channel = pool[0]  # The one that started longest ago
+            self.stats["steals"] += 1
+        pool.remove(channel)
+        pool.append(channel)
+        channel.play(sound)
+        self.stats["plays"] += 1
+        return channel
+
+    def estimated_latency_ms(self):
+        """Estimated click-to-sound delay: the length of one mixer buffer.
+
+        A sound starts with the next buffer the mixer fills, so this is the
+        part of the delay the game controls. It is not measured: the sound
+        device and driver add their own output latency, which SDL doesn't
+        report.
+        """
+        if not pygame.mixer.get_init():
+            return None
+        frequency = pygame.mixer.get_init()[0]
+        return AUDIO_BUFFER / frequency * 1000
+
+audio = AudioEngine(AUDIO_CATEGORIES)
+
+class SoundBank:
+    """Sound effects by name, decoded from disk the first time each is used.
+
+    files maps each name to its path relative to GAME_DIR.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.sounds = {}
+
+    def __getitem__(self, name):
+        if HEADLESS:
+            return None  # Nothing plays headless, so nothing is decoded
+        sound = self.sounds.get(name)
+        if sound is None:
+            init_audio()
+            sound = pygame.mixer.Sound(asset_path(self.files[name]))
+            self.sounds[name] = sound
+        return sound
+
+    def __contains__(self, name):
+        return name in self.files
+
+    def keys(self):
+        return self.files.keys()
+
+weapon_sounds = SoundBank({
+    "Daniel": "sounds/daniel_weapon.mp3",
+    "Rob": "sounds/rob_weapon.mp3",
+    "Pete": "sounds/pete_weapon.mp3",
+    "Seb": "sounds/seb_weapon.mp3",
+    "Hera": "sounds/hera_weapon.mp3"
+})
+
+
+# Screen setup, deferred until the game actually needs a window
+screen = None
+display_mode = None  # (size, bit depth, flags) the cached surfaces were converted for
+
+def init_display():
+    """Open the game window (once) and return the screen surface."""
+    if screen is None:
+        pygame.display.init()
+        pygame.font.init()
+        set_display_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        #set_display_mode((0, 0), pygame.FULLSCREEN)
+        #SCREEN_WIDTH, SCREEN_HEIGHT = screen.get_size()
+
+        pygame.display.set_caption("Liquid Rigidity")
+        mark_startup("window")
+    return screen
+
+def set_display_mode(size, flags=0):
+    """Set the window mode, dropping cached surfaces converted for a different one."""
+    global screen, display_mode
+    screen = pygame.display.set_mode(size, flags)
+    mode = (screen.get_size(), screen.get_bitsize(), screen.get_flags())
+    if mode != display_mode:
+        display_mode = mode
+        image_cache.clear()
+        data_point_images.clear()
+        flame_bases.clear()
+        flame_images.clear()
+        solid_surfaces.clear()
+        static_layers.clear()
+        clear_text_cache()
+        renderer.invalidate()
+    return screen
+
+# Fixed-timestep simulation
+SIM_RATE = 60  # Simulation steps per second; all speeds are in pixels per step
+RENDER_FPS = int(os.environ.get("LRP_FPS", SIM_RATE))  # Display frame cap, e.g. 144 (0 = uncapped)
+MAX_STEPS_PER_FRAME = 5  # Frame-skip limit: simulation steps run before a frame must be drawn
+MAX_FRAME_TIME = 250  # Longest frame (ms) fed to the simulation, e.g. after dragging the window
+
+class SimulationLimit(Exception):
+    """Raised by the clock when a run reaches its frame budget."""
+
+class GameClock:
+    """Clock for controlling the frame rate.
+
+    In normal play this wraps pygame.time.Clock. With virtual=True (headless
+    mode) time only exists on paper: tick() advances it by exactly one frame
+    at the requested rate and delay() moves it forward, neither sleeps, so
+    levels run uncapped and independent of the host's speed.
+    """
+
+    def __init__(self, virtual=False):
+        self.virtual = virtual
+        self.clock = pygame.time.Clock()
+        self.time = 0.0  # Virtual time in milliseconds
+        self.frames = 0
+        self.frame_limit = None
+
+    def reset(self, frame_limit=None):
+        self.time = 0.0
+        self.frames = 0
+        self.frame_limit = frame_limit
+
+    def tick(self, fps=0):
+        self.frames += 1
+        if self.frame_limit is not None and self.frames >= self.frame_limit:
+            raise SimulationLimit()
+        if not self.virtual:
+            return self.clock.tick(fps)
+        step = 1000 / (fps or SIM_RATE)
+        self.time += step
+        return step
+
+    def get_ticks(self):
+        if self.virtual:
+            return int(self.time)
+        return pygame.time.get_ticks()
+
+    def delay(self, milliseconds):
+        if self.virtual:
+            self.time += milliseconds
+        else:
+            pygame.time.delay(milliseconds)
 
 # Clock for controlling the frame rate
-clock = pygame.time.Clock()
+clock = GameClock(virtual=HEADLESS)
+
+# Random source for everything spawned in the levels, seeded per level run
+rng = random.Random()
+
+# Tunable level parameters; benchmarks and stress runs override these
+settings = {
+    "level1_enemies": 5,
+    "level2_brains": 10,
+    "level2_obstacles": 5,
+    "level3_animals": 10,
+    "level3_enemies": 3,
+    "level4_enemies": 5,
+    "level4_chase": False,  # Enemies follow a flow field to the player instead of wandering (much harder)
+    "level4_safe_distance": 8,  # Enemies never start fewer steps than this from the player
+    "level4_maze_size": None,  # (columns, rows) in tiles for a generated, scrolling maze
+    "level4_flow_radius": 40,  # How many steps from the player enemies in a generated maze notice them
+    "level5_flame_growth": 1,  # Flame size added every simulation step
+    "level5_flame_shrink": 5,  # Flame size taken off by each water hit
+    "level6_win_threshold": 50,  # Data points required to win
+    "level6_max_missed": 5,  # Missed data points before failure
+    "level6_max_data_points": 15,
+    "level6_max_glitches": 10,
+    "level6_spawn_rate": 1000,  # Milliseconds between spawns
+    "level6_spawn_batch": 1,  # Data points and glitches dropped per spawn
+    "max_projectiles": 4096,  # Shots of one kind that can be in flight at once
+    "swarm_threshold": 1000,  # Groups this big use the NumPy entity arrays when available
+    "endless": False,  # Levels 2, 4 and 6 never end: hits, misses, catches and 7-Eleven visits are only counted
+}
+
+@contextlib.contextmanager
+def overridden_settings(**overrides):
+    """Temporarily change some settings, e.g. for a level variant."""
+    saved = dict(settings)
+    settings.update(overrides)
+    try:
+        yield
+    finally:
+        settings.clear()
+        settings.update(saved)
+
+# What the running level shows bot policies, and how the last level run ended
+scene = {}
+last_outcome = None
+
+def start_level(**objects):
+    """Expose a level's player, groups and layout to bots (see bots.py) and forget the last outcome."""
+    global last_outcome
+    last_outcome = None
+    scene.clear()
+    scene.update(objects)
+
+def end_level(result, cause, stepper, **stats):
+    """Record how a level run ended: result is "win" or "loss" and cause says why."""
+    global last_outcome
+    last_outcome = {"result": result, "cause": cause, "time_ms": stepper.time, **stats}
+
+# Player input
+class KeyState:
+    """Stand-in for pygame.key.get_pressed() built from a set of held keys."""
+
+    def __init__(self, keys=()):
+        self.keys = frozenset(keys)
+
+    def __getitem__(self, key):
+        return key in self.keys
+
+class LiveInput:
+    """Keyboard and mouse input straight from pygame."""
+
+    def events(self):
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key == PROFILER_KEY:
+                frame_timer.toggle_overlay()
+        return events
+
+    def get_pressed(self):
+        return pygame.key.get_pressed()
+
+    def get_mouse_pos(self):
+        return pygame.mouse.get_pos()
+
+    def frame_time(self, milliseconds):
+        """How much time the frame that just ended took (FixedStep asks every input source)."""
+        return milliseconds
+
+# Events that come from the player rather than the window
+USER_INPUT_EVENTS = (pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP,
+                     pygame.MOUSEMOTION, pygame.MOUSEWHEEL)
+
+class ScriptedInput:
+    """Feeds the levels a fixed input script instead of the keyboard and mouse.
+
+    frames is a sequence of (keys, mouse_pos, clicks) tuples, one per frame:
+    the held keys, the mouse position and the mouse buttons clicked in that
+    frame. Clicks are delivered as MOUSEBUTTONDOWN events. The script loops
+    when it runs out, so it can drive any number of frames.
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.frame = -1
+        self.keys = KeyState()
+        self.mouse_pos = (0, 0)
+
+    def events(self):
+        # Real input is ignored, only window events get through
+        events = [event for event in pygame.event.get() if event.type not in USER_INPUT_EVENTS]
+        self.frame += 1
+        keys, self.mouse_pos, clicks = self.frames[self.frame % len(self.frames)]
+        self.keys = keys if isinstance(keys, KeyState) else KeyState(keys)
+        for button in clicks:
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=button, pos=self.mouse_pos))
+        return events
+
+    def get_pressed(self):
+        return self.keys
+
+    def get_mouse_pos(self):
+        return self.mouse_pos
+
+    def frame_time(self, milliseconds):
+        return milliseconds
+
+# Replay files: header, JSON metadata, then one frame record (plus its clicked buttons) per level frame
+REPLAY_MAGIC = b"LRPR"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sBH")  # Magic, version, length of the metadata
+REPLAY_FRAME = struct.Struct("<BhhdB")  # Held keys, mouse x, mouse y, frame time (ms), number of clicks
+REPLAY_KEYS = (pygame.K_w, pygame.K_a, pygame.K_s, pygame.K_d)  # The keys the levels read, one bit each
+
+class InputRecorder:
+    """Passes another input source through to the levels and records everything they read from it.
+
+    For each level frame it stores the held keys (as bits over REPLAY_KEYS),
+    the mouse position, the clicked buttons and the frame time FixedStep
+    used. The levels get the recorded values back, so a ReplayInput of the
+    file feeds them exactly the same input. With the seed and the player
+    in the metadata, a replay plays out the same as the session did.
+    The file is written by save(), or at exit.
+    """
+
+    def __init__(self, source, path, seed, player=None):
+        self.source = source
+        self.path = path
+        self.seed = seed
+        self.player = player
+        self.data = bytearray()
+        self.pending = None  # The current frame's record, waiting for its frame time
+        self.keys = KeyState()
+        self.mouse_pos = (0, 0)
+        atexit.register(self.save)
+
+    def events(self):
+        self.flush()
+        events = self.source.events()
+        pressed = self.source.get_pressed()
+        held = [key for key in REPLAY_KEYS if pressed[key]]
+        self.keys = KeyState(held)
+        self.mouse_pos = tuple(self.source.get_mouse_pos())
+        clicks = bytes(event.button for event in events if event.type == pygame.MOUSEBUTTONDOWN)
+        bits = sum(1 << REPLAY_KEYS.index(key) for key in held)
+        self.pending = [bits, self.mouse_pos[0], self.mouse_pos[1], 0.0, clicks]
+        return events
+
+    def get_pressed(self):
+        return self.keys
+
+    def get_mouse_pos(self):
+        return self.mouse_pos
+
+    def frame_time(self, milliseconds):
+        milliseconds = self.source.frame_time(milliseconds)
+        if self.pending is not None:
+            self.pending[3] = milliseconds
+        return milliseconds
+
+    def flush(self):
+        if self.pending is not None:
+            bits, x, y, milliseconds, clicks = self.pending
+            self.data += REPLAY_FRAME.pack(bits, x, y, milliseconds, len(clicks)) + clicks
+            self.pending = None
+
+    def save(self):
+        self.flush()
+        meta = json.dumps({"seed": self.seed, "player": self.player, "sim_rate": SIM_RATE}).encode()
+        with open(self.path, "wb") as f:
+            f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, len(meta)))
+            f.write(meta)
+            f.write(self.data)
+
+class ReplayInput:
+    """Feeds the levels the input of a file written by InputRecorder, frame by frame.
+
+    Works like ScriptedInput, but also replays each frame's recorded frame
+    time, so FixedStep runs the same simulation steps as the recorded
+    session whatever the speed of the replay. Raises SimulationLimit when
+    the recording runs out.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, meta_length = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a version {REPLAY_VERSION} replay")
+        offset = REPLAY_HEADER.size
+        meta = json.loads(data[offset:offset + meta_length])
+        self.seed = meta["seed"]
+        self.player = meta["player"]
+        offset += meta_length
+
+        self.frames = []
+        while offset < len(data):
+            bits, x, y, milliseconds, count = REPLAY_FRAME.unpack_from(data, offset)
+            offset += REPLAY_FRAME.size
+            clicks = tuple(data[offset:offset + count])
+            offset += count
+            keys = KeyState(key for i, key in enumerate(REPLAY_KEYS) if bits & (1 << i))
+            self.frames.append((keys, (x, y), clicks, milliseconds))
+        self.frame = -1
+        self.keys = KeyState()
+        self.mouse_pos = (0, 0)
+
+    def events(self):
+        events = [event for event in pygame.event.get() if event.type not in USER_INPUT_EVENTS]
+        self.frame += 1
+        if self.frame >= len(self.frames):
+            raise SimulationLimit()
+        self.keys, self.mouse_pos, clicks, _ = self.frames[self.frame]
+        for button in clicks:
+            events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=button, pos=self.mouse_pos))
+        return events
+
+    def get_pressed(self):
+        return self.keys
+
+    def get_mouse_pos(self):
+        return self.mouse_pos
+
+    def frame_time(self, milliseconds):
+        return self.frames[self.frame][3]
+
+controls = LiveInput()
+
+PROFILE_PHASES = ("events", "player", "groups", "collisions", "draw", "flip")
+PROFILE_HISTORY = 240  # Frames kept for the overlay (one pixel column each)
+PROFILE_CSV = os.environ.get("LRP_PROFILE_CSV")  # Write every measured frame to this CSV file
+PROFILER_KEY = pygame.K_F3  # Shows and hides the profiler overlay
+
+class FrameTimer:
+    """Splits the time of each level frame into phases.
+
+    A level loop calls begin_frame() at the top of a frame and mark(phase)
+    after each phase in PROFILE_PHASES; the time since the previous mark is
+    added to that phase, so phases marked inside the fixed-step loop add up
+    over the steps. end_frame() stores the frame as a dict of phase timings
+    (in seconds) plus its total in frames, a ring buffer of the last
+    PROFILE_HISTORY frames.
+
+    Nothing is measured unless enabled is set: by the benchmarks, by F3,
+    which also shows the overlay, or by LRP_PROFILE_CSV=path, which writes
+    one CSV row per frame. Disabled, a mark() is just a flag check.
+    """
+
+    def __init__(self, csv_path=None):
+        self.csv_path = csv_path
+        self.enabled = csv_path is not None
+        self.overlay = False
+        self.scene = ""  # Level name for the CSV rows
+        self.frames = deque(maxlen=PROFILE_HISTORY)
+        self.current = {}
+        self.start = 0.0
+        self.last = 0.0
+        self.csv = None
+        self.rows = 0
+
+    def begin_frame(self):
+        if self.enabled:
+            self.start = self.last = time.perf_counter()
+            self.current = {}
+
+    def mark(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self.current[phase] = self.current.get(phase, 0.0) + now - self.last
+            self.last = now
+
+    def end_frame(self):
+        if self.enabled:
+            self.current["total"] = self.last - self.start
+            self.frames.append(self.current)
+            if self.csv_path is not None:
+                self.write_row(self.current)
+
+    def write_row(self, frame):
+        if self.csv is None:
+            csv_file = open(self.csv_path, "w", newline="")
+            atexit.register(csv_file.close)
+            self.csv = csv.writer(csv_file)
+            self.csv.writerow(["scene", "frame", "total_ms"] + [f"{phase}_ms" for phase in PROFILE_PHASES])
+        self.rows += 1
+        self.csv.writerow([self.scene, self.rows, f"{frame['total'] * 1000:.3f}"]
+                          + [f"{frame.get(phase, 0.0) * 1000:.3f}" for phase in PROFILE_PHASES])
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        self.enabled = self.overlay or self.csv_path is not None
+        self.frames.clear()
+
+    def draw_overlay(self, surface):
+        """Frame-time graph of the recent frames, with the phases that took longest."""
+        panel = pygame.Rect(8, surface.get_height() - 152, PROFILE_HISTORY + 8, 144)  # Bottom left, clear of the level HUDs
+        surface.fill(BLACK, panel)
+        graph_bottom = panel.y + 70
+        budget = 1000 / SIM_RATE
+        scale = 2  # Pixels per millisecond
+        budget_y = graph_bottom - int(budget * scale)
+        pygame.draw.line(surface, GREEN, (panel.x, budget_y), (panel.right - 1, budget_y))
+        for x, frame in enumerate(self.frames, panel.x + 4):
+            ms = frame["total"] * 1000
+            top = max(graph_bottom - int(ms * scale), panel.y + 4)
+            pygame.draw.line(surface, WHITE if ms <= budget else RED, (x, graph_bottom), (x, top))
+
+        font = get_font(18)
+        lines = ["F3 profiler: no frames yet"]
+        if self.frames:
+            totals = [frame["total"] * 1000 for frame in self.frames]
+            lines = [f"frame {totals[-1]:.1f} ms  avg {sum(totals) / len(totals):.1f}  max {max(totals):.1f}"]
+            worst = []
+            for phase in PROFILE_PHASES:
+                times = [frame.get(phase, 0.0) * 1000 for frame in self.frames]
+                worst.append((sum(times) / len(times), max(times), phase))
+            worst.sort(reverse=True)
+            lines += [f"{phase}: avg {average:.2f}  max {peak:.2f} ms" for average, peak, phase in worst[:3]]
+        latency = audio.estimated_latency_ms()
+        if latency is not None:
+            lines.append(f"audio ~{latency:.1f} ms  steals {audio.stats['steals']}  drops {audio.stats['drops']}")
+        for i, line in enumerate(lines):
+            surface.blit(font.render(line, True, WHITE), (panel.x + 4, graph_bottom + 4 + i * 14))
+
+frame_timer = FrameTimer(PROFILE_CSV)
+
+# Profiling whole scenes: LRP_PROFILE=cprofile (deterministic) or sample (low overhead), or --profile
+PROFILE_MODES = ("cprofile", "sample")
+profile_mode = os.environ.get("LRP_PROFILE") or None
+if profile_mode not in (None,) + PROFILE_MODES:
+    raise SystemExit(f"LRP_PROFILE={profile_mode!r} is not a profiler; use {' or '.join(PROFILE_MODES)}")
+profile_dir = os.environ.get("LRP_PROFILE_DIR", os.path.join(GAME_DIR, "profiles"))
+PROFILE_SAMPLE_INTERVAL = 0.001  # Seconds between stack samples
+PROFILE_STAMP = time.strftime("%Y%m%d-%H%M%S")  # Keeps the files of different sessions apart
+profile_sessions = []  # Profilers of the scenes being run, innermost last
+profile_runs = 0
+
+class StackSampler:
+    """Sampling profiler: a background thread records the profiled thread's stack every interval.
+
+    The stacks are counted in collapsed form, one "outer;inner;leaf count"
+    line each, which flamegraph.pl and speedscope read directly. Has the same
+    enable/disable/dump_stats methods as cProfile.Profile.
+    """
+
+    def __init__(self, interval=PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.target = None
+        self.thread = None
+        self.running = False
+
+    def enable(self):
+        self.target = threading.get_ident()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            time.sleep(self.interval)
+
+    def dump_stats(self, path):
+        with open(path, "w") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+@contextlib.contextmanager
+def profiled_scene(name):
+    """Profile a scene when profiling is on, writing one file per run to profile_dir.
+
+    cProfile runs give <stamp>-<run>-<name>.prof (for pstats or snakeviz),
+    sampled runs <stamp>-<run>-<name>.collapsed. A scene started from inside
+    another, like a level's intro, gets its own file while the outer
+    profiler pauses.
+    """
+    global profile_runs
+    if profile_mode is None:
+        yield
+        return
+
+    if profile_mode == "cprofile":
+        import cProfile  # Only loaded when asked for
+        profiler = cProfile.Profile()
+    else:
+        profiler = StackSampler()
+    if profile_sessions:
+        profile_sessions[-1].disable()
+    profile_sessions.append(profiler)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_sessions.pop()
+        profile_runs += 1
+        os.makedirs(profile_dir, exist_ok=True)
+        extension = ".prof" if profile_mode == "cprofile" else ".collapsed"
+        path = os.path.join(profile_dir, f"{PROFILE_STAMP}-{profile_runs:03d}-{name}{extension}")
+        profiler.dump_stats(path)
+        print(f"Profile of {name} written to {path}")
+        if profile_sessions:
+            profile_sessions[-1].enable()
+
+def profiled(function):
+    """Decorator for scene functions like the intros: profile each call under the function's name."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with profiled_scene(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
+class FixedStep:
+    """Accumulator for a fixed-timestep level loop.
+
+    Every drawn frame, steps() yields once for each whole simulation step
+    that fits in the time accumulated so far, so the game runs at SIM_RATE
+    whatever the display rate. Before each step the positions of tracked
+    sprites are saved; afterwards alpha (0..1) says how far the display time
+    lies between the previous and the current simulation state, and the
+    renderer draws tracked sprites interpolated by that amount.
+
+    If the machine falls behind, at most MAX_STEPS_PER_FRAME steps run
+    between two drawn frames (the frames in between are skipped) and the
+    rest of the backlog is dropped and counted in dropped_steps, so a slow
+    frame can't snowball into ever longer catch-up frames.
+    """
+
+    def __init__(self, *tracked):
+        self.step_ms = 1000 / SIM_RATE
+        self.accumulator = self.step_ms  # The first frame runs one step
+        self.alpha = 1.0
+        self.time = 0.0  # Simulated milliseconds since the level started
+        self.steps_run = 0
+        self.dropped_steps = 0
+        self.tracked = []
+        self.pools = []  # Array-backed objects that save their own positions
+        self.track(*tracked)
+
+    def track(self, *items):
+        """Interpolate these sprites or sprite groups when drawing."""
+        for item in items:
+            if isinstance(item, pygame.sprite.Sprite):
+                self.tracked.append((item,))
+            elif hasattr(item, "snapshot"):
+                self.pools.append(item)
+            else:
+                self.tracked.append(item)
+        self.snapshot()
+
+    def snapshot(self):
+        for sprites in self.tracked:
+            for sprite in sprites:
+                sprite.previous_pos = sprite.rect.topleft
+        for pool in self.pools:
+            pool.snapshot()
+
+    def advance(self, elapsed_ms):
+        """Add a frame's worth of real (or virtual) time to the accumulator."""
+        self.accumulator += min(controls.frame_time(elapsed_ms), MAX_FRAME_TIME)
+
+    def steps(self):
+        count = int((self.accumulator + 1e-6) // self.step_ms)
+        if count > MAX_STEPS_PER_FRAME:
+            self.dropped_steps += count - MAX_STEPS_PER_FRAME
+            self.accumulator -= (count - MAX_STEPS_PER_FRAME) * self.step_ms
+            count = MAX_STEPS_PER_FRAME
+        for _ in range(count):
+            self.snapshot()
+            self.accumulator -= self.step_ms
+            self.time += self.step_ms
+            self.steps_run += 1
+            yield
+        self.alpha = min(max(self.accumulator / self.step_ms, 0.0), 1.0)
+        renderer.alpha = self.alpha
 
 # Load music files
 level_music = {
@@ -59,9 +834,67 @@ level_music = {
 
 }
 
+# Shared font registry and rendered text cache
+TEXT_CACHE_SIZE = 256  # Maximum number of rendered text surfaces kept around
+
+fonts = {}
+text_cache = OrderedDict()
+text_cache_stats = {"hits": 0, "misses": 0}
+
+def get_font(font_size):
+    """Return the shared default font for a size, loading it on first use."""
+    font = fonts.get(font_size)
+    if font is None:
+        font = pygame.font.Font(None, font_size)
+        fonts[font_size] = font
+    return font
+
+def render_text(message, font_size=32, color=BLACK, antialias=True):
+    """Return a rendered text surface, reusing a cached one when possible."""
+    key = (message, font_size, tuple(color), antialias)
+    text = text_cache.get(key)
+    if text is not None:
+        text_cache.move_to_end(key)
+        text_cache_stats["hits"] += 1
+        return text
+
+    text_cache_stats["misses"] += 1
+    text = get_font(font_size).render(message, antialias, color).convert_alpha()
+    text_cache[key] = text
+    if len(text_cache) > TEXT_CACHE_SIZE:
+        text_cache.popitem(last=False)  # Evict the least recently used surface
+    return text
+
+def clear_text_cache():
+    text_cache.clear()
+    text_cache_stats["hits"] = 0
+    text_cache_stats["misses"] = 0
+
+# Images, decoded, scaled and converted to the display format once per display mode
+image_cache = {}
+
+# Images the game loads, checked and built by assets.py
+HOT_DOG_IMAGE = "images/hot_dog.jpg"
+image_files = [HOT_DOG_IMAGE]
+
+def display_format(image, alpha=False):
+    """Return a copy of a surface converted to the display's pixel format for fast blits."""
+    return image.convert_alpha() if alpha else image.convert()
+
+def load_image(path, size=None, alpha=False):
+    """Return an image asset, scaled to size and converted for fast blits."""
+    key = (path, size, alpha)
+    image = image_cache.get(key)
+    if image is None:
+        image = pygame.image.load(asset_path(path))
+        if size is not None:
+            image = pygame.transform.scale(image, size)
+        image = display_format(image, alpha)
+        image_cache[key] = image
+    return image
+
 def draw_label(message, position, font_size=32, color=BLACK):
-    font = pygame.font.Font(None, font_size)
-    text = font.render(message, True, color)
+    text = render_text(message, font_size, color)
     text_rect = text.get_rect(center=position)
     screen.blit(text, text_rect)
 
@@ -70,32 +903,327 @@ class Button:
         self.rect = pygame.Rect(x, y, width, height)
         self.text = text
         self.callback = callback
-        self.font = pygame.font.Font(None, 32)
+        self.font_size = 32
         self.color = GRAY
 
     def draw(self, screen):
         pygame.draw.rect(screen, self.color, self.rect)
         pygame.draw.rect(screen, BLACK, self.rect, 2)  # Outline
-        text_surface = self.font.render(self.text, True, BLACK)
+        text_surface = render_text(self.text, self.font_size, BLACK)
         text_rect = text_surface.get_rect(center=self.rect.center)
         screen.blit(text_surface, text_rect)
 
-    def handle_event(self, event):
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-            if self.rect.collidepoint(event.pos):
-                self.callback()
+    def is_clicked(self, event):
+        return event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint(event.pos)
 
+    def handle_event(self, event):
+        if self.is_clicked(event):
+            self.callback()
+            return True
+        return False
+
+
+# Rendering
+DIRTY_RECTS = os.environ.get("LRP_DIRTY_RECTS") == "1"  # Only push changed screen regions to the display
+
+solid_surfaces = {}
+
+def solid_surface(size, color):
+    """Return a shared surface of the given size filled with a solid color."""
+    key = (size[0], size[1], tuple(color))
+    surface = solid_surfaces.get(key)
+    if surface is None:
+        surface = pygame.Surface(size)
+        surface.fill(color)
+        solid_surfaces[key] = surface
+    return surface
+
+class Renderer:
+    """Draws a level frame and presents it to the display.
+
+    Level loops call start_scene() once, then begin(), draw()/blit()/fill()
+    and present() every frame. In the default mode this is the usual clear,
+    draw and pygame.display.flip(). In dirty-rect mode (LRP_DIRTY_RECTS=1) the
+    draw calls are queued; present() compares them with the previous frame,
+    restores the background only where something appeared, moved or vanished,
+    redraws the parts of sprites overlapping those areas in one batched blit
+    and pushes just those regions with pygame.display.update(rects). A frame
+    that draws a swarm big enough to paint (see EntityArrays.paint) is drawn
+    the default way instead, since it changes most of the screen anyway.
+
+    A scene bigger than the screen passes a Camera to start_scene(); sprites
+    and swarms are then drawn relative to the camera's view and sprites
+    outside it are skipped. blit(), fill() and label() stay in screen
+    coordinates, for HUD text and for scenes that place things themselves.
+    """
+
+    def __init__(self, dirty=False):
+        self.dirty = dirty
+        self.queueing = dirty  # Whether this frame's draw calls are being queued
+        self.background = WHITE
+        self.items = []
+        self.previous = {}
+        self.full_redraw = True
+        self.alpha = 1.0
+        self.camera = None
+
+    def start_scene(self, background, camera=None):
+        """Set the background (a color or a full-screen surface) and redraw everything next frame."""
+        self.background = background
+        self.camera = camera
+        self.previous = {}
+        self.full_redraw = True
+        self.alpha = 1.0
+
+    @property
+    def offset(self):
+        """World position of the screen's top-left corner."""
+        return self.camera.view.topleft if self.camera is not None else (0, 0)
+
+    def world_position(self, sprite):
+        """Where a sprite is this frame: between its previous and current position when it is interpolated."""
+        previous = getattr(sprite, "previous_pos", None)
+        if previous is None or self.alpha >= 1.0:
+            return sprite.rect.topleft
+        x, y = sprite.rect.topleft
+        return (round(previous[0] + (x - previous[0]) * self.alpha),
+                round(previous[1] + (y - previous[1]) * self.alpha))
+
+    def position(self, sprite):
+        """Where to draw a sprite on the screen."""
+        x, y = self.world_position(sprite)
+        if self.camera is None:
+            return x, y
+        left, top = self.camera.view.topleft
+        return x - left, y - top
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def clear(self, rects=None):
+        if isinstance(self.background, pygame.Surface):
+            if rects is None:
+                screen.blit(self.background, (0, 0))
+            else:
+                screen.blits([(self.background, rect, rect) for rect in rects], doreturn=False)
+        elif rects is None:
+            screen.fill(self.background)
+        else:
+            for rect in rects:
+                screen.fill(self.background, rect)
+
+    def begin(self):
+        self.items = []
+        self.queueing = self.dirty
+        if not self.queueing:
+            self.clear()
+
+    def stop_queueing(self):
+        """Draw the rest of this frame directly and present it with a full flip."""
+        self.clear()
+        screen.blits(self.items, doreturn=False)
+        self.items = []
+        self.queueing = False
+
+    def blit(self, image, rect):
+        if self.queueing:
+            self.items.append((image, image.get_rect(topleft=(rect[0], rect[1]))))
+        else:
+            screen.blit(image, rect)
+
+    def draw(self, group):
+        if hasattr(group, "draw_items"):  # Array-backed group, e.g. a ProjectilePool
+            if self.queueing and group.paintable(screen):
+                self.stop_queueing()
+            if not self.queueing and group.paint(screen, self.alpha, self.offset):
+                return
+            items = group.draw_items(self.alpha, self.offset)
+        elif self.camera is not None:
+            view = self.camera.view
+            items = [(sprite.image, self.position(sprite)) for sprite in group if view.colliderect(sprite.rect)]
+        else:
+            items = [(sprite.image, self.position(sprite)) for sprite in group]
+        if self.queueing:
+            self.items.extend((image, image.get_rect(topleft=position)) for image, position in items)
+        else:
+            screen.blits(items, doreturn=False)
+
+    def draw_sprite(self, sprite):
+        self.blit(sprite.image, self.position(sprite))
+
+    def fill(self, color, rect):
+        if self.queueing:
+            rect = pygame.Rect(rect)
+            self.items.append((solid_surface(rect.size, color), rect))
+        else:
+            screen.fill(color, rect)
+
+    def label(self, message, position, font_size=32, color=BLACK):
+        text = render_text(message, font_size, color)
+        self.blit(text, text.get_rect(center=position))
+
+    def present(self):
+        if frame_timer.overlay:
+            if self.queueing:
+                self.stop_queueing()
+            frame_timer.draw_overlay(screen)
+        if not self.queueing:
+            pygame.display.flip()
+            if self.dirty:  # Dropped out of dirty-rect mode for this frame
+                self.previous = {}
+                self.full_redraw = True
+            return
+
+        current = {}
+        for image, rect in self.items:
+            current[(id(image), rect.x, rect.y, rect.w, rect.h)] = (image, rect)
+
+        if self.full_redraw:
+            dirty = [screen.get_rect()]
+        else:
+            # Anything that appeared, moved, changed image or disappeared is dirty
+            dirty = [rect for key, (image, rect) in current.items() if key not in self.previous]
+            dirty.extend(rect for key, (image, rect) in self.previous.items() if key not in current)
+            dirty = merge_rects(dirty)
+        self.previous = current
+        self.full_redraw = False
+        if not dirty:
+            return
+
+        self.clear(dirty)
+        blits = []
+        for image, rect in self.items:
+            for index in rect.collidelistall(dirty):
+                area = rect.clip(dirty[index])
+                blits.append((image, area, area.move(-rect.x, -rect.y)))
+        screen.blits(blits, doreturn=False)
+        pygame.display.update(dirty)
+
+def merge_rects(rects):
+    """Merge overlapping rectangles so no screen area is redrawn twice."""
+    merged = []
+    for rect in rects:
+        rect = rect.clip(screen.get_rect())
+        if not rect.w or not rect.h:
+            continue
+        index = rect.collidelist(merged)
+        while index != -1:
+            rect.union_ip(merged.pop(index))
+            index = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
+
+renderer = Renderer(DIRTY_RECTS)
+
+# Pre-rendered static layers, by scene name: (key, surface)
+static_layers = {}
+
+def static_layer(name, key, build):
+    """Return a full-screen surface holding a scene's unchanging geometry.
+
+    build(surface) draws the walls, grids, doors etc. onto the new surface. It
+    only runs again when key (e.g. the level layout) differs from the one the
+    cached layer was built for, so a frame starts with a single blit.
+    """
+    layer = static_layers.get(name)
+    if layer is None or layer[0] != key:
+        surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        build(surface)
+        layer = (key, surface)
+        static_layers[name] = layer
+    return layer[1]
 
 # Play music function
 def play_music(level):
-    pygame.mixer.music.load(level_music[level])
+    if HEADLESS:
+        return  # Nobody is listening
+    path = asset_path(level_music[level])
+    if not os.path.exists(path):
+        print(f"No music for {level}: {level_music[level]} is missing")
+        return  # Whatever was playing keeps playing
+    init_audio()
+    pygame.mixer.music.load(path)
     pygame.mixer.music.play(-1)
 
+def stop_music():
+    if pygame.mixer.get_init():
+        pygame.mixer.music.stop()
+
+# Idle scenes
+IDLE_FPS = 10  # Wake-up rate for scenes where nothing is moving
+
+# Events after which the window contents may have to be repainted
+REPAINT_EVENTS = (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE, pygame.WINDOWEXPOSED,
+                  pygame.WINDOWRESTORED, pygame.WINDOWSIZECHANGED)
+
+def wait_for_scene(draw, handle_event, default=True):
+    """Show a static scene and block until handle_event returns something other than None.
+
+    The process sleeps in pygame.event.wait() between events and only repaints
+    when the window contents were lost, so a waiting screen costs no CPU.
+    When time is virtual (headless runs, benchmarks) nothing waits: queued
+    events are handled and, if none of them finishes the scene, default is
+    returned.
+    """
+    draw()
+    pygame.display.flip()
+    mark_startup("first_frame")
+    if clock.virtual:
+        for event in pygame.event.get():
+            result = handle_event(event)
+            if result is not None:
+                return result
+        return default
+    while True:
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            sys.exit()
+        result = handle_event(event)
+        if result is not None:
+            return result
+        if event.type in REPAINT_EVENTS:
+            draw()
+            pygame.display.flip()
+
+def pace_frame(active, fps=RENDER_FPS):
+    """Frame pacing for mostly static scenes; returns the frame time in milliseconds.
+
+    While something is moving the scene runs at the normal frame rate. Otherwise
+    the loop sleeps until the next input event (or at most 1 / IDLE_FPS seconds)
+    instead of spinning through identical frames. Time spent idle is reported
+    as a single simulation step so the scene doesn't fast-forward on wake-up.
+    """
+    if active or clock.virtual:
+        return clock.tick(fps if active else IDLE_FPS)
+    event = pygame.event.wait(1000 // IDLE_FPS)
+    if event.type != pygame.NOEVENT:
+        pygame.event.post(event)  # Leave the event for the scene's own event loop
+    clock.tick()
+    return 1000 / SIM_RATE
+
+def draw_intro_lines(lines, font_size=32, y_offset=50):
+    for line in lines:
+        text = render_text(line, font_size, BLACK)
+        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
+        y_offset += 40
+
+def display_intro(lines):
+    """Show story lines with a "Start Level" button and wait for the button to be clicked."""
+    start_button = Button(SCREEN_WIDTH // 2 - 75, SCREEN_HEIGHT - 100, 150, 50, "Start Level", lambda: None)
+
+    def draw():
+        screen.fill(WHITE)
+        draw_intro_lines(lines)
+        start_button.draw(screen)  # Draw the button
+
+    # Wait for the player to press the button
+    wait_for_scene(draw, lambda event: True if start_button.handle_event(event) else None)
+
 # Display story
+@profiled
 def display_story():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 32)
-    story_lines = [
+    display_intro([
         "There it was, just like old faithful...",
         "The eternal Fountain of Filth.",
         "I took a walk straight out of town,", 
@@ -105,37 +1233,7 @@ def display_story():
         "Now, you must fight the filth,", 
         "and destroy the fountain to escape its grip.",
         "Prepare for the first challenge: The Fountain of Filth.",
-    ]
-
-    y_offset = 50
-    for line in story_lines:
-        text = font.render(line, True, BLACK)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-        y_offset += 40
-
-    start_button = Button(SCREEN_WIDTH // 2 - 75, SCREEN_HEIGHT - 100, 150, 50, "Start Level", lambda: None)
-
-     # Wait for the player to press the button
-    running = True
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            start_button.handle_event(event)  # Check if button is clicked
-
-        screen.fill(WHITE)
-        y_offset = 50
-        for line in story_lines:
-            text = font.render(line, True, BLACK)
-            screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-            y_offset += 40
-
-        start_button.draw(screen)  # Draw the button
-        pygame.display.flip()
-        clock.tick(60)
-        if pygame.mouse.get_pressed()[0] and start_button.rect.collidepoint(pygame.mouse.get_pos()):
-            running = False  # Exit intro loop when button is clicked
+    ])
 
 # Player class
 class Player(pygame.sprite.Sprite):
@@ -145,6 +1243,7 @@ class Player(pygame.sprite.Sprite):
         self.image = pygame.Surface((40, 40), pygame.SRCALPHA)
         self.image.fill(characters[name]["color"])
         pygame.draw.rect(self.image, BLACK, self.image.get_rect(), 3)  # Black outline
+        self.image = self.image.convert()  # Fully opaque, so blit it without per-pixel alpha
         self.rect = self.image.get_rect()
         self.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 100)
         self.speed = characters[name]["speed"]
@@ -153,12 +1252,12 @@ class Player(pygame.sprite.Sprite):
     def move(self, dx, dy, walls):
         # Check for collisions on the X axis
         self.rect.x += dx
-        if pygame.sprite.spritecollide(self, walls, False):
+        if hits_wall(self, walls):
             self.rect.x -= dx
 
         # Check for collisions on the Y axis
         self.rect.y += dy
-        if pygame.sprite.spritecollide(self, walls, False):
+        if hits_wall(self, walls):
             self.rect.y -= dy
 
 
@@ -172,18 +1271,20 @@ class Player(pygame.sprite.Sprite):
         if keys[pygame.K_s] and self.rect.bottom < SCREEN_HEIGHT:
             self.rect.y += self.speed
 
-    def use_weapon(self, mouse_pos):
+    def use_weapon(self, mouse_pos, bullets):
         print(f"{self.name} used {self.weapon} towards {mouse_pos}!")
         direction = pygame.math.Vector2(mouse_pos[0] - self.rect.centerx, mouse_pos[1] - self.rect.centery).normalize()
-        weapon_sounds[self.name].play()
-        return Bullet(self.rect.center, direction)
+        audio.play(weapon_sounds[self.name], "weapon")
+        bullets.fire(self.rect.center, direction)
 
 # Bullet class
 class Bullet(pygame.sprite.Sprite):
+    color = RED
+    margin = 10  # Removed once entirely off screen
+
     def __init__(self, position, direction):
         super().__init__()
-        self.image = pygame.Surface((10, 10))
-        self.image.fill(RED)
+        self.image = solid_surface((10, 10), self.color)
         self.rect = self.image.get_rect(center=position)
         self.velocity = direction * 10
 
@@ -200,8 +1301,8 @@ class Brain(pygame.sprite.Sprite):
         self.image = pygame.Surface((30, 30))
         self.image.fill(GREEN)
         self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, SCREEN_WIDTH - self.rect.width)
-        self.rect.y = random.randint(0, SCREEN_HEIGHT - self.rect.height)
+        self.rect.x = rng.randint(0, SCREEN_WIDTH - self.rect.width)
+        self.rect.y = rng.randint(0, SCREEN_HEIGHT - self.rect.height)
 
 # Obstacle class
 class Obstacle(pygame.sprite.Sprite):
@@ -210,10 +1311,10 @@ class Obstacle(pygame.sprite.Sprite):
         self.image = pygame.Surface((40, 40))
         self.image.fill(RED)
         self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, SCREEN_WIDTH - self.rect.width)
-        self.rect.y = random.randint(0, SCREEN_HEIGHT - self.rect.height)
-        self.speed_x = random.choice([-2, 2])  # Horizontal speed
-        self.speed_y = random.choice([-2, 2])  # Vertical speed
+        self.rect.x = rng.randint(0, SCREEN_WIDTH - self.rect.width)
+        self.rect.y = rng.randint(0, SCREEN_HEIGHT - self.rect.height)
+        self.speed_x = rng.choice([-2, 2])  # Horizontal speed
+        self.speed_y = rng.choice([-2, 2])  # Vertical speed
 
     def update(self):
         # Move the obstacle
@@ -226,36 +1327,65 @@ class Obstacle(pygame.sprite.Sprite):
         if self.rect.top <= 0 or self.rect.bottom >= SCREEN_HEIGHT:
             self.speed_y = -self.speed_y
 
+# Flame images: one solid surface per color, sliced into a cached view per size
+FLAME_MAX_SIZE = 300  # Level 5 is lost once the flame grows this big
+FLAME_GREEN_STEP = 10  # Flame colors are rounded to steps of this much green
+
+flame_bases = {}  # green -> surface of at least FLAME_MAX_SIZE filled with that color
+flame_images = {}  # (size, green) -> subsurface of the base for that green
+
+def flame_image(size, green):
+    """Return the shared flame surface for a size and an amount of green."""
+    size = max(size, 1)  # A flame shrunk to nothing is still a pixel until it's removed
+    green -= green % FLAME_GREEN_STEP
+    key = (size, green)
+    image = flame_images.get(key)
+    if image is None:
+        base = flame_bases.get(green)
+        if base is None or base.get_width() < size:
+            base_size = max(size, FLAME_MAX_SIZE)
+            base = pygame.Surface((base_size, base_size))
+            base.fill((255, green, 0))
+            flame_bases[green] = base
+        image = base.subsurface((0, 0, size, size))
+        flame_images[key] = image
+    return image
+
 class Flame(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
-        self.image = pygame.Surface((50, 50), pygame.SRCALPHA)
-        self.image.fill((255, 100, 0))  # Orange flames
+        self.image = flame_image(50, 100)  # Orange flames
         self.rect = self.image.get_rect(center=(x, y))
         self.size = 50  # Initial flame size
-        self.growth_rate = 1  # Rate at which flames grow over time
+        self.growth_rate = settings["level5_flame_growth"]  # Rate at which flames grow over time
+        self.shrink_rate = settings["level5_flame_shrink"]  # Size lost per water hit
+
+    def resize(self):
+        """Show the flame at its current size, in a random color."""
+        self.image = flame_image(self.size, rng.randint(50, 100))
+        center = self.rect.center
+        self.rect.size = (self.size, self.size)
+        self.rect.center = center
 
     def grow(self):
         """Increase the size of the flame."""
         self.size += self.growth_rate
-        self.image = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-        self.image.fill((255, random.randint(50, 100), 0))  # Randomize flame color
-        self.rect = self.image.get_rect(center=self.rect.center)
+        self.resize()
 
     def shrink(self):
         """Shrink the flame when hit by water."""
         if self.size > 20:  # Minimum size
-            self.size -= 5
-            self.image = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-            self.image.fill((255, random.randint(50, 100), 0))
-            self.rect = self.image.get_rect(center=self.rect.center)
+            self.size = max(self.size - self.shrink_rate, 1)
+            self.resize()
 
 
 class Water(pygame.sprite.Sprite):
+    color = (0, 0, 255)  # Blue water
+    margin = 0  # Removed as soon as its corner leaves the screen
+
     def __init__(self, position, direction):
         super().__init__()
-        self.image = pygame.Surface((10, 10))
-        self.image.fill((0, 0, 255))  # Blue water
+        self.image = solid_surface((10, 10), self.color)
         self.rect = self.image.get_rect(center=position)
         self.velocity = direction * 10
 
@@ -267,44 +1397,455 @@ class Water(pygame.sprite.Sprite):
         if not (0 <= self.rect.x <= SCREEN_WIDTH and 0 <= self.rect.y <= SCREEN_HEIGHT):
             self.kill()
 
+# Level 6 falling objects
+class Faller(pygame.sprite.Sprite):
+    color = None  # Set when the image is a solid block of this color
+
+    def __init__(self, center, velocity):
+        super().__init__()
+        self.image = self.make_image()
+        self.rect = self.image.get_rect(center=center)
+        self.velocity = velocity
+
+    def update(self):
+        self.rect.y += self.velocity
+        if self.rect.top > SCREEN_HEIGHT:  # Fell off the screen
+            self.kill()
+
+data_point_images = {}
+
+class DataPoint(Faller):
+    @staticmethod
+    def make_image():
+        image = data_point_images.get("data")
+        if image is None:
+            image = pygame.Surface((20, 20), pygame.SRCALPHA)
+            pygame.draw.circle(image, (0, 255, 255), (10, 10), 10)  # Cyan glowing data
+            image = display_format(image, alpha=True)
+            data_point_images["data"] = image
+        return image
+
+class Glitch(Faller):
+    color = (255, 0, 0)  # Red for glitches
+
+    @classmethod
+    def make_image(cls):
+        return solid_surface((30, 30), cls.color)
+
+
+# Broadphase collision
+GRID_CELL_SIZE = 64  # A bit bigger than the largest moving sprite
+
+class SpatialGrid:
+    """Uniform-grid broadphase for sprite-vs-sprite collisions.
+
+    rebuild(sprites) buckets each sprite under the grid cells its rect
+    overlaps. query(rect) then only tests the sprites sharing a cell with the
+    rect, and pairs(others) collects every overlapping (other, sprite) pair
+    up front, so callers can kill or move sprites afterwards without changing
+    a group they are still iterating over. With entities spread over the
+    screen the cost grows with their number, not with the product of the
+    two group sizes.
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cells_for(self, rect):
+        size = self.cell_size
+        for column in range(rect.left // size, (rect.right - 1) // size + 1):
+            for row in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                yield column, row
+
+    def rebuild(self, sprites):
+        self.cells.clear()
+        for sprite in sprites:
+            for cell in self.cells_for(sprite.rect):
+                bucket = self.cells.get(cell)
+                if bucket is None:
+                    self.cells[cell] = [sprite]
+                else:
+                    bucket.append(sprite)
+
+    def query(self, rect):
+        """Return the registered sprites overlapping rect, in the order they were added."""
+        found = {}
+        for cell in self.cells_for(rect):
+            for sprite in self.cells.get(cell, ()):
+                if sprite not in found and sprite.rect.colliderect(rect):
+                    found[sprite] = True
+        return list(found)
+
+    def pairs(self, others):
+        """Return every (other, sprite) pair where a sprite from others overlaps a registered one."""
+        return [(other, sprite) for other in others for sprite in self.query(other.rect)]
+
+
+# Array-backed entities
+SWARM_PAINT_MIN = 1000  # Solid-colored swarms this big are painted in one pass instead of blitted
+
+class EntityArrays:
+    """Same-looking entities kept in NumPy arrays instead of one sprite each.
+
+    Live entities are packed at the front of the position and velocity arrays
+    in the order they were added, positions being whole-pixel top-left
+    corners, so subclasses can move, bounce and remove all of them in a few
+    whole-array operations per step. The container stands in for a sprite
+    group: FixedStep saves its positions (snapshot) and Renderer.draw draws
+    it (draw_items, or paint for big solid-colored swarms).
+    """
+
+    def __init__(self, image, capacity, color=None):
+        self.image = image
+        self.width, self.height = image.get_size()
+        self.color = color  # Set when image is a solid block of this color
+        self.capacity = capacity
+        self.pos = np.zeros((capacity, 2))
+        self.previous = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        self.scratch = np.zeros((capacity, 2))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, x, y, vx=0, vy=0):
+        """Add an entity; returns False if the arrays are full."""
+        if self.count == self.capacity:
+            return False
+        slot = self.count
+        self.pos[slot] = (x, y)
+        self.previous[slot] = (x, y)
+        self.velocity[slot] = (vx, vy)
+        self.count += 1
+        return True
+
+    def keep(self, alive):
+        """Drop the entities where alive is False, keeping the rest in order."""
+        kept = int(np.count_nonzero(alive))
+        if kept == self.count:
+            return
+        for column in (self.pos, self.previous, self.velocity):
+            column[:kept] = column[:self.count][alive]
+        self.count = kept
+
+    def snapshot(self):
+        self.previous[:self.count] = self.pos[:self.count]
+
+    def overlapping(self, rect):
+        """Mask of the live entities overlapping rect."""
+        x, y = self.pos[:self.count, 0], self.pos[:self.count, 1]
+        return ((x < rect.right) & (x + self.width > rect.left)
+                & (y < rect.bottom) & (y + self.height > rect.top))
+
+    def collide_rect(self, rect):
+        return self.count > 0 and bool(self.overlapping(rect).any())
+
+    def hit_sprites(self, group):
+        """Return the sprites in group that any entity overlaps.
+
+        Sweep and prune: with the entities sorted by x, a binary search per
+        sprite finds the run of entities overlapping it horizontally, and only
+        those candidates are checked vertically, all in a few array operations.
+        """
+        sprites = list(group)
+        if self.count == 0 or not sprites:
+            return []
+        rects = np.array([tuple(sprite.rect) for sprite in sprites], dtype=float)
+        order = np.argsort(self.pos[:self.count, 0], kind="stable")
+        xs = self.pos[order, 0]
+        first = np.searchsorted(xs, rects[:, 0] - self.width, side="right")
+        end = np.searchsorted(xs, rects[:, 0] + rects[:, 2], side="left")
+        counts = np.maximum(end - first, 0)
+        total = int(counts.sum())
+        if total == 0:
+            return []
+
+        # One row per (sprite, candidate entity) pair
+        owner = np.repeat(np.arange(len(sprites)), counts)
+        offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidate = order[first[owner] + offset]
+        y = self.pos[candidate, 1]
+        hit = (y < rects[owner, 1] + rects[owner, 3]) & (y + self.height > rects[owner, 1])
+        return [sprites[index] for index in np.unique(owner[hit]).tolist()]
+
+    def remove_overlapping(self, rect):
+        """Remove the entities overlapping rect and return how many there were."""
+        if self.count == 0:
+            return 0
+        hit = self.overlapping(rect)
+        hits = int(np.count_nonzero(hit))
+        if hits:
+            self.keep(~hit)
+        return hits
+
+    def positions(self, alpha=1.0, offset=(0, 0)):
+        """Drawing positions, interpolated and rounded like Renderer.position does for sprites."""
+        pos = self.pos[:self.count]
+        if alpha < 1.0:
+            previous = self.previous[:self.count]
+            pos = np.subtract(pos, previous, out=self.scratch[:self.count])
+            pos *= alpha
+            pos += previous
+            np.rint(pos, out=pos)
+        if offset != (0, 0):  # Scrolled by a camera
+            pos = np.subtract(pos, offset, out=self.scratch[:self.count])
+        return pos
+
+    def draw_items(self, alpha=1.0, offset=(0, 0)):
+        """(image, position) pairs for a batched blit."""
+        image = self.image
+        return [(image, xy) for xy in self.positions(alpha, offset).tolist()]
+
+    def paintable(self, surface):
+        return self.color is not None and self.count >= SWARM_PAINT_MIN and surface.get_bytesize() == 4
+
+    def paint(self, surface, alpha=1.0, offset=(0, 0)):
+        """Fill the area covered by the entities in one pass; False if they should be blitted instead.
+
+        Every entity is an identical solid block, so drawing them all is the
+        same as filling the union of their rects. The union comes from a
+        difference grid: +1/-1 at the corners of each rect, then a 2D prefix
+        sum gives how many rects cover each pixel. Its cost depends on the
+        screen size, not on how many entities there are.
+        """
+        if not self.paintable(surface):
+            return False
+        width, height = surface.get_size()
+        pos = self.positions(alpha, offset)
+        left = np.clip(pos[:, 0], 0, width).astype(np.intp)
+        top = np.clip(pos[:, 1], 0, height).astype(np.intp)
+        right = np.clip(pos[:, 0] + self.width, 0, width).astype(np.intp)
+        bottom = np.clip(pos[:, 1] + self.height, 0, height).astype(np.intp)
+
+        stride = height + 1  # Laid out [x, y] like surfarray
+        corners = np.concatenate((left * stride + top, right * stride + bottom,
+                                  left * stride + bottom, right * stride + top))
+        weights = np.repeat(np.array([1.0, 1.0, -1.0, -1.0]), self.count)
+        coverage = np.bincount(corners, weights, (width + 1) * stride).reshape(width + 1, stride)
+        np.cumsum(coverage, axis=0, out=coverage)
+        np.cumsum(coverage, axis=1, out=coverage)
+
+        pixels = pygame.surfarray.pixels2d(surface)
+        np.copyto(pixels, surface.map_rgb(self.color), where=coverage[:width, :height] > 0.5)
+        del pixels  # Unlock the surface
+        return True
+
+class ObstacleSwarm(EntityArrays):
+    """Obstacles as arrays: same spawning, movement and edge bouncing as the sprite."""
+
+    def __init__(self, capacity):
+        super().__init__(solid_surface((40, 40), RED), capacity, RED)
+
+    def spawn(self):
+        x = rng.randint(0, SCREEN_WIDTH - self.width)
+        y = rng.randint(0, SCREEN_HEIGHT - self.height)
+        return self.add(x, y, rng.choice([-2, 2]), rng.choice([-2, 2]))
 
+    def update(self):
+        pos = self.pos[:self.count]
+        velocity = self.velocity[:self.count]
+        pos += velocity
+        x, y = pos[:, 0], pos[:, 1]
+        velocity[(x <= 0) | (x + self.width >= SCREEN_WIDTH), 0] *= -1
+        velocity[(y <= 0) | (y + self.height >= SCREEN_HEIGHT), 1] *= -1
+        return 0
+
+class EnemySwarm(EntityArrays):
+    """Maze enemies as arrays: they walk diagonally, turn back at walls and turn at random.
+
+    The random turns come from a NumPy generator seeded from rng, so seeded
+    runs repeat, but not move for move like the Enemy sprites.
+    """
+
+    def __init__(self, capacity):
+        super().__init__(solid_surface((40, 40), RED), capacity, RED)
+        self.speed = 2
+        self.random = None  # NumPy generator for the random turns, seeded from rng on first use
+
+    def spawn(self, x, y):
+        return self.add(x, y, self.speed * rng.choice([-1, 1]), self.speed * rng.choice([-1, 1]))
+
+    def update(self, walls, flow=None):
+        if flow is not None:
+            return self.chase(flow)
+
+        pos = self.pos[:self.count]
+        velocity = self.velocity[:self.count]
+        pos += velocity
+
+        # Step back and reverse when walking into a wall
+        blocked = walls.collides_many(pos, self.width, self.height)
+        pos[blocked] -= velocity[blocked]
+        velocity[blocked] *= -1
+
+        # 5% chance to change direction, like rng.randint(0, 100) < 5
+        if self.random is None:
+            self.random = np.random.default_rng(rng.getrandbits(64))
+        turn = self.random.integers(0, 101, self.count) < 5
+        turns = int(np.count_nonzero(turn))
+        if turns:
+            velocity[turn] = self.speed * self.random.choice((-1, 1), (turns, 2))
+        return 0
+
+    def chase(self, flow):
+        """Like Enemy.chase, for every enemy lined up with a tile at once."""
+        pos = self.pos[:self.count]
+        velocity = self.velocity[:self.count]
+        size = flow.grid.tile_size
+        aligned = (pos[:, 0] % size == 0) & (pos[:, 1] % size == 0)
+        column = (pos[aligned, 0] // size).astype(np.intp)
+        row = (pos[aligned, 1] // size).astype(np.intp)
+        inside = (column >= 0) & (column < flow.grid.columns) & (row >= 0) & (row < flow.grid.rows)
+        index = np.where(inside, row * flow.grid.columns + column, 0)
+        steps = np.stack((np.frombuffer(flow.step_x, dtype=np.int8)[index],
+                          np.frombuffer(flow.step_y, dtype=np.int8)[index]), axis=1)
+        steps[~inside] = 0
+        velocity[aligned] = self.speed * steps
+        pos += velocity
+        return 0
+
+class FallerSwarm(EntityArrays):
+    """Level 6 data points or glitches as arrays, dropping down the screen."""
+
+    def __init__(self, sprite_class, capacity):
+        super().__init__(sprite_class.make_image(), capacity, sprite_class.color)
+
+    def spawn(self, center, velocity):
+        return self.add(center[0] - self.width // 2, center[1] - self.height // 2, 0, velocity)
+
+    def update(self):
+        """Move down; returns how many fell off the bottom of the screen (and were removed)."""
+        pos = self.pos[:self.count]
+        pos += self.velocity[:self.count]
+        count = self.count
+        self.keep(pos[:, 1] <= SCREEN_HEIGHT)
+        return count - self.count
+
+class EntityGroup(pygame.sprite.Group):
+    """Sprite-per-entity stand-in for the swarms above, with the same interface."""
+
+    def __init__(self, sprite_class):
+        super().__init__()
+        self.sprite_class = sprite_class
+
+    def spawn(self, *args):
+        self.add(self.sprite_class(*args))
+        return True
+
+    def update(self, *args):
+        """Update every sprite; returns how many removed themselves."""
+        count = len(self)
+        super().update(*args)
+        return count - len(self)
+
+    def collide_rect(self, rect):
+        return any(sprite.rect.colliderect(rect) for sprite in self)
+
+    def remove_overlapping(self, rect):
+        hits = [sprite for sprite in self if sprite.rect.colliderect(rect)]
+        for sprite in hits:
+            sprite.kill()
+        return len(hits)
+
+    def hit_sprites(self, group):
+        """Return the sprites in group that any sprite of this group overlaps."""
+        grid = SpatialGrid()
+        grid.rebuild(self)
+        return [sprite for sprite in group if grid.query(sprite.rect)]
+
+def entity_group(sprite_class, capacity):
+    """Return an empty group for up to capacity entities of a sprite class.
+
+    Big groups of a kind that has an array-backed swarm get the swarm when
+    NumPy is installed; everything else is a plain EntityGroup of sprites.
+    """
+    swarm_class = SWARMS.get(sprite_class)
+    if swarm_class and capacity >= settings["swarm_threshold"] and numpy_available():
+        return swarm_class(capacity)
+    return EntityGroup(sprite_class)
+
+# Projectiles
+PROJECTILE_SIZE = 10
+PROJECTILE_SPEED = 10
+
+class ProjectilePool(EntityArrays):
+    """Shots of one kind (Bullet or Water) kept in preallocated NumPy arrays.
+
+    Moving all shots and dropping the ones that left the screen is a few
+    whole-array operations per step instead of one sprite each. Slots of
+    dead shots are reused, every shot shares one image, and once capacity
+    shots are in flight new ones are ignored. Positions snap to whole pixels
+    the way pygame.Rect does, so shots travel exactly like the sprites they
+    replace.
+    """
+
+    def __init__(self, sprite_class, capacity=None):
+        image = solid_surface((PROJECTILE_SIZE, PROJECTILE_SIZE), sprite_class.color)
+        super().__init__(image, capacity or settings["max_projectiles"], sprite_class.color)
+        self.margin = sprite_class.margin
+
+    def fire(self, position, direction):
+        """Launch a shot centered on position; returns False if the pool is full."""
+        return self.add(position[0] - PROJECTILE_SIZE // 2, position[1] - PROJECTILE_SIZE // 2,
+                        direction[0] * PROJECTILE_SPEED, direction[1] * PROJECTILE_SPEED)
+
+    def update(self):
+        pos = self.pos[:self.count]
+        scratch = self.scratch[:self.count]
+        pos += self.velocity[:self.count]
+        # Round to whole pixels, halves away from zero, like assigning to a Rect
+        np.abs(pos, out=scratch)
+        scratch += 0.5
+        np.floor(scratch, out=scratch)
+        np.copysign(scratch, pos, out=pos)
+
+        x, y = pos[:, 0], pos[:, 1]
+        self.keep((x >= -self.margin) & (x <= SCREEN_WIDTH) & (y >= -self.margin) & (y <= SCREEN_HEIGHT))
+
+class ProjectileGroup(EntityGroup):
+    """Stand-in for ProjectilePool with one sprite per shot, used without NumPy."""
+
+    def fire(self, position, direction):
+        if len(self) >= settings["max_projectiles"]:
+            return False
+        return self.spawn(position, direction)
+
+def projectile_group(sprite_class):
+    """Return an empty container for Bullet or Water shots."""
+    if numpy_available():
+        return ProjectilePool(sprite_class)
+    return ProjectileGroup(sprite_class)
 
 # Function to display the welcome screen
 def welcome_screen():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 36)
-    text = font.render("Welcome to Liquid Rigidity!", True, BLACK)
-    screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 100))
+    def draw():
+        screen.fill(WHITE)
+        text = render_text("Welcome to Liquid Rigidity!", 36, BLACK)
+        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 100))
 
-    instructions = font.render("Choose your character:", True, BLACK)
-    screen.blit(instructions, (SCREEN_WIDTH // 2 - instructions.get_width() // 2, 150))
+        instructions = render_text("Choose your character:", 36, BLACK)
+        screen.blit(instructions, (SCREEN_WIDTH // 2 - instructions.get_width() // 2, 150))
 
-    y_offset = 200
-    for i, character in enumerate(characters.keys()):
-        char_text = font.render(f"{i + 1}. {character}", True, BLACK)
-        screen.blit(char_text, (SCREEN_WIDTH // 2 - char_text.get_width() // 2, y_offset))
-        y_offset += 50
+        y_offset = 200
+        for i, character in enumerate(characters.keys()):
+            char_text = render_text(f"{i + 1}. {character}", 36, BLACK)
+            screen.blit(char_text, (SCREEN_WIDTH // 2 - char_text.get_width() // 2, y_offset))
+            y_offset += 50
 
-    pygame.display.flip()
+    def handle_event(event):
+        if event.type == pygame.KEYDOWN:
+            if event.key in [pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5]:
+                return list(characters.keys())[event.key - pygame.K_1]
+        return None
 
-    selected = None
-    while not selected:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.KEYDOWN:
-                if event.key in [pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4, pygame.K_5]:
-                    selected = list(characters.keys())[event.key - pygame.K_1]
-    return selected
+    return wait_for_scene(draw, handle_event, default=list(characters.keys())[0])
 
 # Function to display the map world
 def map_world(player):
     play_music("map")  # Play map music
-    screen.fill(GRAY)
-    font = pygame.font.Font(None, 36)
-    text = font.render("Map World - Explore and enter levels!", True, BLACK)
-    screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 50))
+    text = render_text("Map World - Explore and enter levels!", 36, BLACK)
 
     doors = []
     for i in range(8):  # Create 8 doors for levels
@@ -312,33 +1853,50 @@ def map_world(player):
         door_y = 200 + (i // 4) * 150
         door_rect = pygame.Rect(door_x, door_y, 50, 50)
         doors.append(door_rect)
-        pygame.draw.rect(screen, BLACK, door_rect)
-        door_text = font.render(f"{i + 1}", True, WHITE)
-        screen.blit(door_text, (door_x + 15, door_y + 15))
+
+    def draw_map(surface):
+        surface.fill(GRAY)
+        surface.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 50))
+        for i, door_rect in enumerate(doors):
+            pygame.draw.rect(surface, BLACK, door_rect)
+            door_text = render_text(f"{i + 1}", 36, WHITE)
+            surface.blit(door_text, (door_rect.x + 15, door_rect.y + 15))
+
+    renderer.start_scene(static_layer("map", tuple(map(tuple, doors)), draw_map))
 
     # Place the player in the center of the map
     player.rect.center = (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
 
-    pygame.display.flip()
-
+    stepper = FixedStep(player)
     in_map = True
+    repaint = True
     while in_map:
-        for event in pygame.event.get():
+        frame_timer.begin_frame()  # Dropped again if nothing changes
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
-
-        keys = pygame.key.get_pressed()
-        player.update(keys)
-
-        screen.fill(GRAY)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, 50))
+            if event.type in REPAINT_EVENTS or (event.type == pygame.KEYDOWN and event.key == PROFILER_KEY):
+                repaint = True
+                renderer.invalidate()
+        frame_timer.mark("events")
+
+        keys = controls.get_pressed()
+        last_position = player.rect.topleft
+        for _ in stepper.steps():
+            player.update(keys)
+        moved = player.rect.topleft != last_position or renderer.position(player) != last_position
+        frame_timer.mark("player")
+
+        if not (moved or repaint):
+            stepper.advance(pace_frame(False))  # Nothing changed, sleep until there is input
+            continue
+        repaint = False
+
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
         for i, door_rect in enumerate(doors):
-            pygame.draw.rect(screen, BLACK, door_rect)
-            door_text = font.render(f"{i + 1}", True, WHITE)
-            screen.blit(door_text, (door_rect.x + 15, door_rect.y + 15))
-
             if player.rect.colliderect(door_rect):  # Check collision with doors
                 if i == 0:  # Level 1
                     display_story()
@@ -356,65 +1914,79 @@ def map_world(player):
                     return "level5"
                 elif i == 5:  # Level 6
                     return "level6"
+        frame_timer.mark("collisions")
 
+        renderer.draw_sprite(player)
 
-
-        screen.blit(player.image, player.rect)
-
-        pygame.display.flip()
-        clock.tick(60)
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(pace_frame(moved))
 
 
 # Level 1 gameplay
 def level1(player):
     play_music("level1")
     enemies = pygame.sprite.Group()
-    bullets = pygame.sprite.Group()
-    for _ in range(5):
+    bullets = projectile_group(Bullet)
+    for _ in range(settings["level1_enemies"]):
         enemies.add(Obstacle())
 
+    renderer.start_scene(WHITE)
+    stepper = FixedStep(player, bullets, enemies)
+    start_level(player=player, enemies=enemies, bullets=bullets)
     running = True
     while running:
-        screen.fill(WHITE)
+        frame_timer.begin_frame()
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
-        for event in pygame.event.get():
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left mouse button
-                    bullet = player.use_weapon(pygame.mouse.get_pos())
-                    bullets.add(bullet)
+                    player.use_weapon(controls.get_mouse_pos(), bullets)
+        frame_timer.mark("events")
 
-        keys = pygame.key.get_pressed()
-        player.update(keys)
+        keys = controls.get_pressed()
+        for _ in stepper.steps():
+            player.update(keys)
+            frame_timer.mark("player")
 
-        bullets.update()
-        enemies.update()
+            bullets.update()
+            enemies.update()
+            frame_timer.mark("groups")
 
-        for bullet in bullets:
-            pygame.sprite.spritecollide(bullet, enemies, True)
+            for enemy in bullets.hit_sprites(enemies):
+                enemy.kill()
+            frame_timer.mark("collisions")
 
-        bullets.draw(screen)
-        enemies.draw(screen)
-        screen.blit(player.image, player.rect)
+        renderer.draw(bullets)
+        renderer.draw(enemies)
+        renderer.draw_sprite(player)
 
         if len(enemies) == 0:  # All enemies defeated
             draw_label("All enemies defeated! Returning to the map world.", (SCREEN_WIDTH // 2, 30))
             pygame.display.flip()  # Update the screen to show the label
-            pygame.time.delay(2000)  # Wait for 2 seconds
+            clock.delay(2000)  # Wait for 2 seconds
             #print("All enemies defeated! Returning to the map world.")
-            pygame.mixer.music.stop()
+            end_level("win", "enemies defeated", stepper)
+            stop_music()
             return "map"
 
-        pygame.display.flip()
-        clock.tick(60)
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(clock.tick(RENDER_FPS))
 
 
+@profiled
 def display_level2_intro():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 32)
-    intro_lines = [
+    display_intro([
         "Man began his career on Earth as a sex-obsessed ape.",
         "He wished only to make his sex life the source of all happiness",
         "through the eating of brains.",
@@ -424,106 +1996,98 @@ def display_level2_intro():
         "Prepare yourself to delve into the dark origins of human intelligence,",
         "and face the consequences of the gruesome brain-eating practice.",
         "Welcome to Level 2: The Beginning Was the End."
-    ]
+    ])
 
-    y_offset = 50
-    for line in intro_lines:
-        text = font.render(line, True, BLACK)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-        y_offset += 40
-
-    start_button = Button(SCREEN_WIDTH // 2 - 75, SCREEN_HEIGHT - 100, 150, 50, "Start Level", lambda: None)
-
-     # Wait for the player to press the button
-    running = True
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            start_button.handle_event(event)  # Check if button is clicked
-
-        screen.fill(WHITE)
-        y_offset = 50
-        for line in intro_lines:
-            text = font.render(line, True, BLACK)
-            screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-            y_offset += 40
-
-        start_button.draw(screen)  # Draw the button
-        pygame.display.flip()
-        clock.tick(60)
-        if pygame.mouse.get_pressed()[0] and start_button.rect.collidepoint(pygame.mouse.get_pos()):
-            running = False  # Exit intro loop when button is clicked
 
 
 # Level 2 gameplay
 def level2(player):
     play_music("level2")
     brains = pygame.sprite.Group()
-    obstacles = pygame.sprite.Group()
+    obstacles = entity_group(Obstacle, settings["level2_obstacles"])
 
     # Add brains and obstacles to the level
-    for _ in range(10):
+    for _ in range(settings["level2_brains"]):
         brains.add(Brain())
-    for _ in range(5):
-        obstacles.add(Obstacle())
+    for _ in range(settings["level2_obstacles"]):
+        obstacles.spawn()
 
     collected_brains = 0
+    obstacle_hits = 0  # Only counted in endless mode
+    renderer.start_scene(WHITE)
+    stepper = FixedStep(player, obstacles)
+    start_level(player=player, brains=brains, obstacles=obstacles)
     running = True
 
     while running:
-        screen.fill(WHITE)
+        frame_timer.begin_frame()
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
-        for event in pygame.event.get():
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
-
-        keys = pygame.key.get_pressed()
-        player.update(keys)
-
-        obstacles.update()
-
-
-        # Check collisions
-        if pygame.sprite.spritecollide(player, brains, True):
-            collected_brains += 1
-            #draw_label(f"Brains collected: {collected_brains}", (SCREEN_WIDTH // 2, 30))
-            #pygame.display.flip()  # Update the screen to show the label
-            #pygame.time.delay(500)  # Wait for 2 seconds
-            print(f"Brains collected: {collected_brains}")
-        if pygame.sprite.spritecollideany(player, obstacles):
-            draw_label("You hit an obstacle! Returning to the map world.", (SCREEN_WIDTH // 2, 30))
-            pygame.display.flip()  # Update the screen to show the label
-            pygame.time.delay(2000)  # Wait for 2 seconds
+        frame_timer.mark("events")
+
+        keys = controls.get_pressed()
+        for _ in stepper.steps():
+            player.update(keys)
+            frame_timer.mark("player")
+
+            obstacles.update()
+            frame_timer.mark("groups")
+
+            # Check collisions
+            if pygame.sprite.spritecollide(player, brains, True):
+                collected_brains += 1
+                #draw_label(f"Brains collected: {collected_brains}", (SCREEN_WIDTH // 2, 30))
+                #pygame.display.flip()  # Update the screen to show the label
+                #pygame.time.delay(500)  # Wait for 2 seconds
+                print(f"Brains collected: {collected_brains}")
+            if obstacles.collide_rect(player.rect):
+                if settings["endless"]:
+                    obstacle_hits += 1
+                    frame_timer.mark("collisions")
+                    continue
+                draw_label("You hit an obstacle! Returning to the map world.", (SCREEN_WIDTH // 2, 30))
+                pygame.display.flip()  # Update the screen to show the label
+                clock.delay(2000)  # Wait for 2 seconds
             
-            #print("You hit an obstacle! Returning to the map world.")
-            pygame.mixer.music.stop()
-            return "map"
-
-        # Draw everything
-        brains.draw(screen)
-        obstacles.draw(screen)
-        screen.blit(player.image, player.rect)
+                #print("You hit an obstacle! Returning to the map world.")
+                end_level("loss", "hit an obstacle", stepper, brains=collected_brains)
+                stop_music()
+                return "map"
 
-        # Check win condition
-        if collected_brains >= 10:
-            draw_label("Level 2 complete! Returning to the map world.", (SCREEN_WIDTH // 2, 30))
-            pygame.display.flip()  # Update the screen to show the label
-            pygame.time.delay(2000)  # Wait for 2 seconds
+            # Check win condition
+            if collected_brains >= settings["level2_brains"] and not settings["endless"]:
+                draw_label("Level 2 complete! Returning to the map world.", (SCREEN_WIDTH // 2, 30))
+                pygame.display.flip()  # Update the screen to show the label
+                clock.delay(2000)  # Wait for 2 seconds
             
-            #print("Level 2 complete! Returning to the map world.")
-            pygame.mixer.music.stop()
-            return "map"
-
-        pygame.display.flip()
-        clock.tick(60)
+                #print("Level 2 complete! Returning to the map world.")
+                end_level("win", "brains collected", stepper, brains=collected_brains)
+                stop_music()
+                return "map"
+            frame_timer.mark("collisions")
 
+        # Draw everything
+        renderer.draw(brains)
+        renderer.draw(obstacles)
+        renderer.draw_sprite(player)
+        if settings["endless"]:
+            renderer.label(f"Brains: {collected_brains}  Obstacle hits: {obstacle_hits}  Obstacles: {len(obstacles)}",
+                           (SCREEN_WIDTH // 2, 20), font_size=24)
+
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(clock.tick(RENDER_FPS))
+
+@profiled
 def display_level3_intro():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 32)
-    intro_lines = [
+    display_intro([
         "In our time, the defense of the innocent and the defense of the Earth",
         "are of the utmost importance. The greed and selfishness of society",
         "is destroying our world and killing animals by the billions.",
@@ -533,37 +2097,7 @@ def display_level3_intro():
         "Set the animals free or scare the humans away to save the planet.",
         "",
         "Welcome to Level 3: Vegan Hate.",
-    ]
-
-    y_offset = 50
-    for line in intro_lines:
-        text = font.render(line, True, BLACK)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-        y_offset += 40
-
-    start_button = Button(SCREEN_WIDTH // 2 - 75, SCREEN_HEIGHT - 100, 150, 50, "Start Level", lambda: None)
-
-     # Wait for the player to press the button
-    running = True
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            start_button.handle_event(event)  # Check if button is clicked
-
-        screen.fill(WHITE)
-        y_offset = 50
-        for line in intro_lines:
-            text = font.render(line, True, BLACK)
-            screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-            y_offset += 40
-
-        start_button.draw(screen)  # Draw the button
-        pygame.display.flip()
-        clock.tick(60)
-        if pygame.mouse.get_pressed()[0] and start_button.rect.collidepoint(pygame.mouse.get_pos()):
-            running = False  # Exit intro loop when button is clicked
+    ])
 
 #Level 3 Gameplay
 def level3(player):
@@ -578,118 +2112,134 @@ def level3(player):
     # Create groups for animals, enemies, and walls
     animals = pygame.sprite.Group()
     enemies = pygame.sprite.Group()
-    walls = pygame.sprite.Group()
-
-    # Create walls
-    for x in range(0, SCREEN_WIDTH, TILE_SIZE):
-        walls.add(Wall(x, 0, TILE_SIZE, TILE_SIZE))  # Top wall
-        walls.add(Wall(x, SCREEN_HEIGHT - TILE_SIZE, TILE_SIZE, TILE_SIZE))  # Bottom wall
-    for y in range(0, SCREEN_HEIGHT, TILE_SIZE):
-        walls.add(Wall(0, y, TILE_SIZE, TILE_SIZE))  # Left wall
-        walls.add(Wall(SCREEN_WIDTH - TILE_SIZE, y, TILE_SIZE, TILE_SIZE))  # Right wall
+    columns, rows = SCREEN_WIDTH // TILE_SIZE, SCREEN_HEIGHT // TILE_SIZE
+    arena = compile_layout(border_layout(columns, rows), TILE_SIZE)  # Walls around the screen edges
+    walls = arena.wall_sprites()
+    wall_grid = arena.grid
 
     # Place animals away from screen edges
-    for _ in range(10):  # Add 10 animals
-        while True:
-            animal = Animal()
-            if TILE_SIZE < animal.rect.x < SCREEN_WIDTH - 2 * TILE_SIZE and TILE_SIZE < animal.rect.y < SCREEN_HEIGHT - 2 * TILE_SIZE:
-                animals.add(animal)
-                break  # Only add the animal if it is within the valid area
-
-    # Add fewer enemies to the level
-    for _ in range(3):  # Add 3 enemies
-        while True:
-            enemy = Enemy(random.randint(1, SCREEN_WIDTH // TILE_SIZE - 2) * TILE_SIZE,
-                          random.randint(1, SCREEN_HEIGHT // TILE_SIZE - 2) * TILE_SIZE)
-            if TILE_SIZE < enemy.rect.x < SCREEN_WIDTH - 2 * TILE_SIZE and TILE_SIZE < enemy.rect.y < SCREEN_HEIGHT - 2 * TILE_SIZE:
-                enemies.add(enemy)
-                break  # Only add the enemy if it is within the valid area
-
+    for _ in range(settings["level3_animals"]):  # Add 10 animals
+        animals.add(Animal((rng.randint(TILE_SIZE + 1, SCREEN_WIDTH - 2 * TILE_SIZE - 1),
+                            rng.randint(TILE_SIZE + 1, SCREEN_HEIGHT - 2 * TILE_SIZE - 1))))
+
+    # Add fewer enemies to the level, on tiles clear of the walls
+    for _ in range(settings["level3_enemies"]):  # Add 3 enemies
+        enemies.add(Enemy(*arena.random_free_position(2, 2, columns - 3, rows - 3)))
+
+    def draw_arena(surface):
+        surface.fill(WHITE)
+        pygame.draw.rect(surface, GREEN, safe_zone)  # Draw the safe zone
+        walls.draw(surface)
+
+    renderer.start_scene(static_layer("level3", (tuple(safe_zone), TILE_SIZE), draw_arena))
+    animal_grid = SpatialGrid()
+    stepper = FixedStep(player, animals, enemies)
+    start_level(player=player, animals=animals, enemies=enemies, safe_zone=safe_zone, walls=wall_grid)
+    rescued = 0
     running = True
 
     while running:
-        screen.fill(WHITE)
+        frame_timer.begin_frame()
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
-        for event in pygame.event.get():
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+        frame_timer.mark("events")
+
+        keys = controls.get_pressed()
+        for _ in stepper.steps():
+            player.update(keys)
+
+            # Check for collisions between player and animals (push animals)
+            for animal in pygame.sprite.spritecollide(player, animals, False):  # Don't remove animals
+                direction = pygame.math.Vector2(0, 0)
+                if keys[pygame.K_a]:
+                    direction.x = -1
+                if keys[pygame.K_d]:
+                    direction.x = 1
+                if keys[pygame.K_w]:
+                    direction.y = -1
+                if keys[pygame.K_s]:
+                    direction.y = 1
 
-        keys = pygame.key.get_pressed()
-        player.update(keys)
-
-        # Check for collisions between player and animals (push animals)
-        for animal in pygame.sprite.spritecollide(player, animals, False):  # Don't remove animals
-            direction = pygame.math.Vector2(0, 0)
-            if keys[pygame.K_a]:
-                direction.x = -1
-            if keys[pygame.K_d]:
-                direction.x = 1
-            if keys[pygame.K_w]:
-                direction.y = -1
-            if keys[pygame.K_s]:
-                direction.y = 1
-
-            if direction.length() > 0:
-                direction = direction.normalize() * 5  # Push animal 5 pixels
-                animal.rect.x += int(direction.x)
-                animal.rect.y += int(direction.y)
-
-                # Keep animals within bounds
-                animal.rect.x = max(TILE_SIZE, min(animal.rect.x, SCREEN_WIDTH - 2 * TILE_SIZE))
-                animal.rect.y = max(TILE_SIZE, min(animal.rect.y, SCREEN_HEIGHT - 2 * TILE_SIZE))
-
-        # Update enemies
-        enemies.update(walls)
-
-        # Check collisions between enemies and animals
-        for enemy in enemies:
-            for animal in pygame.sprite.spritecollide(enemy, animals, True):  # Remove animals caught by enemies
+                if direction.length() > 0:
+                    direction = direction.normalize() * 5  # Push animal 5 pixels
+                    animal.rect.x += int(direction.x)
+                    animal.rect.y += int(direction.y)
+
+                    # Keep animals within bounds
+                    animal.rect.x = max(TILE_SIZE, min(animal.rect.x, SCREEN_WIDTH - 2 * TILE_SIZE))
+                    animal.rect.y = max(TILE_SIZE, min(animal.rect.y, SCREEN_HEIGHT - 2 * TILE_SIZE))
+            frame_timer.mark("player")
+
+            # Update enemies
+            enemies.update(wall_grid)
+            frame_timer.mark("groups")
+
+            # Check collisions between enemies and animals (collect them all, then remove)
+            animal_grid.rebuild(animals)
+            caught = {animal: True for enemy, animal in animal_grid.pairs(enemies)}
+            for animal in caught:
+                animal.kill()  # Remove animals caught by enemies
                 print("An animal has been caught!")
 
-        # Check if animals reach the safe zone
-        for animal in animals:
-            if safe_zone.colliderect(animal.rect):
+            # Check if animals reach the safe zone
+            for animal in [animal for animal in animals if safe_zone.colliderect(animal.rect)]:
                 animals.remove(animal)
+                rescued += 1
                 print("An animal reached the safe zone!")
 
-        # Draw the safe zone
-        pygame.draw.rect(screen, GREEN, safe_zone)
+            # Check win condition
+            if len(animals) == 0:  # All animals rescued or caught
+                lost = settings["level3_animals"] - rescued
+                if lost == 0:
+                    result, cause = "win", "all animals rescued"
+                elif rescued == 0:
+                    result, cause = "loss", "all animals caught"
+                else:
+                    result, cause = "loss", "some animals caught"  # The level ends, but not every animal made it
+                end_level(result, cause, stepper, rescued=rescued, caught=lost)
+                stop_music()
+                if len(animals) == 0:
+                    draw_label("Level complete! Returning to the map world.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
+                    pygame.display.flip()
+                    clock.delay(2000)  # Wait for 2 seconds
+                return "map"
+            frame_timer.mark("collisions")
 
-        # Draw animals, enemies, and walls
-        animals.draw(screen)
-        enemies.draw(screen)
-        walls.draw(screen)
+        # Draw animals and enemies (the safe zone and walls are in the static layer)
+        renderer.draw(animals)
+        renderer.draw(enemies)
 
         # Draw the player
-        screen.blit(player.image, player.rect)
+        renderer.draw_sprite(player)
 
-        # Check win condition
-        if len(animals) == 0:  # All animals rescued or caught
-            pygame.mixer.music.stop()
-            if len(animals) == 0:
-                draw_label("Level complete! Returning to the map world.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-                pygame.display.flip()
-                pygame.time.delay(2000)  # Wait for 2 seconds
-            return "map"
-
-        pygame.display.flip()
-        clock.tick(60)
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(clock.tick(RENDER_FPS))
 
 
 
 
 
 
+# Animal and Human have no array-backed swarm (see SWARMS): level 3 pushes and
+# rescues animals one at a time, so they stay sprites, and Human is never used.
 class Animal(pygame.sprite.Sprite):
-    def __init__(self):
+    def __init__(self, position=None):
         super().__init__()
         self.image = pygame.Surface((30, 30))
         self.image.fill(GREEN)  # Animals are green
         self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, SCREEN_WIDTH - self.rect.width)
-        self.rect.y = random.randint(0, SCREEN_HEIGHT - self.rect.height)
-        self.speed_y = random.choice([-2, 2])
+        if position is None:
+            position = (rng.randint(0, SCREEN_WIDTH - self.rect.width), rng.randint(0, SCREEN_HEIGHT - self.rect.height))
+        self.rect.topleft = position
+        self.speed_y = rng.choice([-2, 2])
 
     def update(self):
         self.rect.y += self.speed_y
@@ -703,19 +2253,18 @@ class Human(pygame.sprite.Sprite):
         self.image = pygame.Surface((40, 40))
         self.image.fill(RED)  # Humans are red
         self.rect = self.image.get_rect()
-        self.rect.x = random.randint(0, SCREEN_WIDTH - self.rect.width)
-        self.rect.y = random.randint(0, SCREEN_HEIGHT - self.rect.height)
-        self.speed_x = random.choice([-2, 2])
+        self.rect.x = rng.randint(0, SCREEN_WIDTH - self.rect.width)
+        self.rect.y = rng.randint(0, SCREEN_HEIGHT - self.rect.height)
+        self.speed_x = rng.choice([-2, 2])
 
     def update(self):
         self.rect.x += self.speed_x
         if self.rect.left < 0 or self.rect.right > SCREEN_WIDTH:
             self.speed_x = -self.speed_x
 
+@profiled
 def display_level4_intro():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 32)
-    intro_lines = [
+    display_intro([
         "Hunger strikes in the dead of night.",
         "The neon glow of 7-Eleven calls to you.",
         "Hot dogs rolling on the grill, fulfilling every need.",
@@ -723,36 +2272,235 @@ def display_level4_intro():
         "find the 7-Eleven, and satisfy your craving.",
         "",
         "Welcome to Level 4: Seven-11 Hot Dog.",
-    ]
-
-    y_offset = 50
-    for line in intro_lines:
-        text = font.render(line, True, BLACK)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-        y_offset += 40
-
-    start_button = Button(SCREEN_WIDTH // 2 - 75, SCREEN_HEIGHT - 100, 150, 50, "Start Level", lambda: None)
-
-    running = True
-    while running:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            start_button.handle_event(event)
-
-        screen.fill(WHITE)
-        y_offset = 50
-        for line in intro_lines:
-            text = font.render(line, True, BLACK)
-            screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-            y_offset += 40
-
-        start_button.draw(screen)
-        pygame.display.flip()
-        clock.tick(60)
-        if pygame.mouse.get_pressed()[0] and start_button.rect.collidepoint(pygame.mouse.get_pos()):
-            running = False  # Exit intro loop when button is clicked
+    ])
+
+class TileGrid:
+    """Solid/free map of a tile layout used for wall collision checks.
+
+    A query only looks at the handful of tiles a rect overlaps, so its cost
+    stays the same however many walls the level has.
+    """
+
+    def __init__(self, columns, rows, tile_size):
+        self.columns = columns
+        self.rows = rows
+        self.tile_size = tile_size
+        self.solid = bytearray(columns * rows)
+
+    def tile_span(self, rect):
+        """Return the (left, top, right, bottom) tile indices a rect overlaps, clamped to the grid."""
+        size = self.tile_size
+        return (max(rect.left // size, 0), max(rect.top // size, 0),
+                min((rect.right - 1) // size, self.columns - 1), min((rect.bottom - 1) // size, self.rows - 1))
+
+    def tile_at(self, position):
+        return position[0] // self.tile_size, position[1] // self.tile_size
+
+    def set_solid(self, rect, solid=True):
+        left, top, right, bottom = self.tile_span(rect)
+        for row in range(top, bottom + 1):
+            for column in range(left, right + 1):
+                self.solid[row * self.columns + column] = solid
+
+    def collides(self, rect):
+        """Return True if the rect overlaps a solid tile."""
+        left, top, right, bottom = self.tile_span(rect)
+        solid = self.solid
+        for row in range(top, bottom + 1):
+            start = row * self.columns
+            for index in range(start + left, start + right + 1):
+                if solid[index]:
+                    return True
+        return False
+
+    def collides_many(self, positions, width, height):
+        """Vectorized collides() for same-sized rects given as an (n, 2) array of top-left corners."""
+        solid = np.frombuffer(self.solid, dtype=np.uint8).reshape(self.rows, self.columns)
+        size = self.tile_size
+        hit = np.zeros(len(positions), dtype=bool)
+        # Sample the rects every tile_size pixels (and at their far edge) so every tile they overlap is looked at
+        for dx in list(range(0, width - 1, size)) + [width - 1]:
+            column = (positions[:, 0] + dx) // size
+            for dy in list(range(0, height - 1, size)) + [height - 1]:
+                row = (positions[:, 1] + dy) // size
+                inside = (column >= 0) & (column < self.columns) & (row >= 0) & (row < self.rows)
+                hit[inside] |= solid[row[inside].astype(np.intp), column[inside].astype(np.intp)] == 1
+        return hit
+
+class FlowField:
+    """Shared breadth-first distance map toward a target tile of a TileGrid.
+
+    update() redoes the search only when the target (the player's tile)
+    changes. Each free tile remembers which neighbour is one step closer to
+    the target, so any number of chasing enemies look up their next move in
+    O(1) instead of each finding its own path.
+
+    With a radius the search stops that many steps from the target, and only
+    the tiles it reached last time are cleared, so on a huge maze an update
+    costs the same as on a small one. Tiles out of reach have no step.
+    """
+
+    NEIGHBOURS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+
+    def __init__(self, grid, radius=None):
+        self.grid = grid
+        self.radius = radius
+        self.target = None
+        cells = grid.columns * grid.rows
+        self.distance = array("i", [-1]) * cells  # Steps to the target, -1 if unreachable
+        self.step_x = array("b", bytes(cells))  # Direction of the next step from each tile
+        self.step_y = array("b", bytes(cells))
+        self.reached = []  # Tiles the last search set
+
+    def update(self, column, row):
+        """Point the field at a new target tile; returns False if it already was."""
+        if (column, row) == self.target:
+            return False
+        self.target = (column, row)
+        columns, rows = self.grid.columns, self.grid.rows
+        distance, step_x, step_y, solid = self.distance, self.step_x, self.step_y, self.grid.solid
+        for index in self.reached:
+            distance[index] = -1
+            step_x[index] = step_y[index] = 0
+        reached = self.reached = []
+        if not (0 <= column < columns and 0 <= row < rows):
+            return True
+
+        limit = self.radius if self.radius is not None else len(distance)
+        distance[row * columns + column] = 0
+        reached.append(row * columns + column)
+        queue = deque([(column, row)])
+        while queue:
+            x, y = queue.popleft()
+            next_distance = distance[y * columns + x] + 1
+            if next_distance > limit:
+                continue
+            for dx, dy in self.NEIGHBOURS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < columns and 0 <= ny < rows:
+                    index = ny * columns + nx
+                    if distance[index] == -1 and not solid[index]:
+                        distance[index] = next_distance
+                        step_x[index] = -dx  # Back the way the search came
+                        step_y[index] = -dy
+                        reached.append(index)
+                        queue.append((nx, ny))
+        return True
+
+    def steps_to_target(self, column, row):
+        """How many steps a tile is from the target; -1 if out of reach."""
+        if 0 <= column < self.grid.columns and 0 <= row < self.grid.rows:
+            return self.distance[row * self.grid.columns + column]
+        return -1
+
+    def step(self, column, row):
+        """(dx, dy) tile step toward the target; (0, 0) on the target or where it can't be reached."""
+        if 0 <= column < self.grid.columns and 0 <= row < self.grid.rows:
+            index = row * self.grid.columns + column
+            return self.step_x[index], self.step_y[index]
+        return 0, 0
+
+def safe_spawn(pick, field, min_distance, tries=50):
+    """Draw pixel positions from pick() until one is at least min_distance steps from field's target.
+
+    Positions the field can't reach count as far enough. After tries draws
+    the farthest one seen is used.
+    """
+    best, best_distance = None, -1
+    for _ in range(tries):
+        position = pick()
+        distance = field.steps_to_target(*field.grid.tile_at(position))
+        if distance < 0 or distance >= min_distance:
+            return position
+        if distance > best_distance:
+            best, best_distance = position, distance
+    return best
+
+class Camera:
+    """The screen-sized part of a big level that is on screen.
+
+    follow() centres the view on a point, stopping at the edges of the level
+    so nothing outside it is shown.
+    """
+
+    def __init__(self, width, height):
+        self.bounds = pygame.Rect(0, 0, width, height)
+        self.view = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    def follow(self, center):
+        self.view.center = center
+        self.view.clamp_ip(self.bounds)
+
+TILEMAP_CHUNK_TILES = 8  # Edge of a TileMap chunk, in tiles
+TILEMAP_CACHE_CHUNKS = 64  # Rendered chunks kept per TileMap
+
+class TileMap:
+    """Draws the walls of a TileGrid bigger than the screen, one square chunk at a time.
+
+    Only the chunks overlapping the camera's view are drawn. A chunk is
+    rendered the first time it comes into view and kept in a small LRU cache,
+    so drawing costs the same for a 20x15 maze as for a 1000x1000 one.
+    Collisions need no chunks: TileGrid.collides only looks at the few tiles
+    a rect overlaps.
+    """
+
+    def __init__(self, grid, highlights=None, color=BLACK, background=WHITE):
+        self.grid = grid
+        self.highlights = highlights or {}  # (column, row): color, e.g. the 7-Eleven
+        self.color = color
+        self.background = background
+        self.chunk_size = TILEMAP_CHUNK_TILES * grid.tile_size
+        self.chunks = OrderedDict()
+
+    def chunk(self, chunk_x, chunk_y):
+        """Return the rendered chunk, drawing it if it isn't cached."""
+        key = (chunk_x, chunk_y)
+        surface = self.chunks.get(key)
+        if surface is not None:
+            self.chunks.move_to_end(key)
+            return surface
+
+        grid, size = self.grid, self.grid.tile_size
+        surface = pygame.Surface((self.chunk_size, self.chunk_size)).convert()
+        surface.fill(self.background)
+        left, top = chunk_x * TILEMAP_CHUNK_TILES, chunk_y * TILEMAP_CHUNK_TILES
+        right, bottom = min(left + TILEMAP_CHUNK_TILES, grid.columns), min(top + TILEMAP_CHUNK_TILES, grid.rows)
+        for row in range(top, bottom):
+            start = row * grid.columns
+            column = left
+            while column < right:  # One fill per run of wall tiles
+                if not grid.solid[start + column]:
+                    column += 1
+                    continue
+                run = column
+                while column < right and grid.solid[start + column]:
+                    column += 1
+                surface.fill(self.color, ((run - left) * size, (row - top) * size, (column - run) * size, size))
+        for (column, row), color in self.highlights.items():
+            if left <= column < right and top <= row < bottom:
+                surface.fill(color, ((column - left) * size, (row - top) * size, size, size))
+
+        self.chunks[key] = surface
+        if len(self.chunks) > TILEMAP_CACHE_CHUNKS:
+            self.chunks.popitem(last=False)
+        return surface
+
+    def visible(self, view):
+        """(surface, screen position) of every chunk overlapping the view rect."""
+        size = self.chunk_size
+        last_x = (self.grid.columns - 1) // TILEMAP_CHUNK_TILES
+        last_y = (self.grid.rows - 1) // TILEMAP_CHUNK_TILES
+        items = []
+        for chunk_y in range(max(view.top // size, 0), min((view.bottom - 1) // size, last_y) + 1):
+            for chunk_x in range(max(view.left // size, 0), min((view.right - 1) // size, last_x) + 1):
+                items.append((self.chunk(chunk_x, chunk_y), (chunk_x * size - view.left, chunk_y * size - view.top)))
+        return items
+
+def hits_wall(sprite, walls):
+    """Check a sprite against walls given either as a TileGrid or as a sprite group."""
+    if isinstance(walls, TileGrid):
+        return walls.collides(sprite.rect)
+    return bool(pygame.sprite.spritecollideany(sprite, walls))
 
 class Wall(pygame.sprite.Sprite):
     def __init__(self, x, y, width, height):
@@ -761,6 +2509,160 @@ class Wall(pygame.sprite.Sprite):
         self.image.fill(BLACK)
         self.rect = self.image.get_rect(topleft=(x, y))
 
+# Level layouts
+LAYOUT_CACHE_DIR = os.path.join(GAME_DIR, ".cache", "layouts")
+LAYOUT_CACHE_VERSION = 1  # Bump when the compiled format changes
+
+compiled_layouts = {}
+
+class CompiledLayout:
+    """An ASCII layout compiled into merged wall rectangles and a free-cell index."""
+
+    def __init__(self, columns, rows, tile_size, walls, free_cells):
+        self.columns = columns
+        self.rows = rows
+        self.tile_size = tile_size
+        self.walls = [pygame.Rect(rect) for rect in walls]  # In pixels
+        self.free_cells = [tuple(cell) for cell in free_cells]  # (column, row) of every non-wall tile
+        self.grid = TileGrid(columns, rows, tile_size)
+        for rect in self.walls:
+            self.grid.set_solid(rect)
+        self.spawn_cells = {}  # (left, top, right, bottom) -> free cells in that tile region
+
+    def wall_sprites(self):
+        return pygame.sprite.Group([Wall(*rect) for rect in self.walls])
+
+    def random_free_position(self, left, top, right, bottom):
+        """Top-left pixel position of a random free tile with column in [left, right] and row in [top, bottom]."""
+        region = (left, top, right, bottom)
+        cells = self.spawn_cells.get(region)
+        if cells is None:
+            cells = [(column, row) for column, row in self.free_cells if left <= column <= right and top <= row <= bottom]
+            self.spawn_cells[region] = cells
+        column, row = rng.choice(cells)
+        return column * self.tile_size, row * self.tile_size
+
+def merge_wall_tiles(solid):
+    """Cover the True cells of a grid with rectangles: the widest run first, then as tall as it stays solid."""
+    solid = [list(row) for row in solid]
+    rects = []
+    for y, row in enumerate(solid):
+        for x in range(len(row)):
+            if not row[x]:
+                continue
+            width = 1
+            while x + width < len(row) and row[x + width]:
+                width += 1
+            height = 1
+            while y + height < len(solid) and all(solid[y + height][x:x + width]):
+                height += 1
+            for covered in solid[y:y + height]:
+                covered[x:x + width] = [False] * width
+            rects.append((x, y, width, height))
+    return rects
+
+def build_layout(layout, tile_size, wall):
+    columns = max(len(row) for row in layout)
+    solid = [[x < len(row) and row[x] == wall for x in range(columns)] for row in layout]
+    return {
+        "columns": columns,
+        "rows": len(layout),
+        "tile_size": tile_size,
+        "walls": [(x * tile_size, y * tile_size, width * tile_size, height * tile_size)
+                  for x, y, width, height in merge_wall_tiles(solid)],
+        "free_cells": [(x, y) for y, row in enumerate(solid) for x, cell in enumerate(row) if not cell],
+    }
+
+def compile_layout(layout, tile_size, wall="W"):
+    """Return the CompiledLayout for rows of layout characters.
+
+    Compiled layouts are kept in memory and in LAYOUT_CACHE_DIR, keyed by a
+    hash of the layout, so a level normally just loads its walls.
+    """
+    key = hashlib.sha1(repr((LAYOUT_CACHE_VERSION, tuple(layout), tile_size, wall)).encode()).hexdigest()
+    compiled = compiled_layouts.get(key)
+    if compiled is not None:
+        return compiled
+
+    path = os.path.join(LAYOUT_CACHE_DIR, key + ".json")
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = build_layout(layout, tile_size, wall)
+        try:
+            os.makedirs(LAYOUT_CACHE_DIR, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(data, f)
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass  # The cache is only an optimization
+    compiled = CompiledLayout(**data)
+    compiled_layouts[key] = compiled
+    return compiled
+
+def border_layout(columns, rows, wall="W"):
+    """Layout rows for an empty arena surrounded by a one-tile wall."""
+    return [wall * columns] + [wall + " " * (columns - 2) + wall] * (rows - 2) + [wall * columns]
+
+MAZE_CORRIDOR = 2  # Corridor width of generated mazes, in tiles
+
+class Maze:
+    """A random maze of about columns x rows tiles, carved into a TileGrid.
+
+    The maze is a grid of cells MAZE_CORRIDOR tiles wide with one-tile walls
+    between them. A depth-first walk from the top-left cell knocks through to
+    a random unvisited neighbour, backing up when there is none, so every
+    cell ends up connected to every other and there is always a way from the
+    start to the 7-Eleven in the far corner. It draws from rng, so a seeded
+    run gets the same maze.
+    """
+
+    def __init__(self, columns, rows, tile_size):
+        pitch = self.pitch = MAZE_CORRIDOR + 1
+        cells_x = self.cells_x = max((columns - 1) // pitch, 1)
+        cells_y = self.cells_y = max((rows - 1) // pitch, 1)
+        self.grid = TileGrid(cells_x * pitch + 1, cells_y * pitch + 1, tile_size)
+        self.grid.solid[:] = b"\x01" * len(self.grid.solid)
+        self.start = self.cell_tile(0, 0)
+        self.goal = self.cell_tile(cells_x - 1, cells_y - 1)
+
+        visited = bytearray(cells_x * cells_y)
+        visited[0] = 1
+        self.open(0, 0, 0, 0)
+        stack = [(0, 0)]
+        while stack:
+            x, y = stack[-1]
+            options = [(nx, ny) for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1))
+                       if 0 <= nx < cells_x and 0 <= ny < cells_y and not visited[ny * cells_x + nx]]
+            if not options:
+                stack.pop()
+                continue
+            nx, ny = rng.choice(options)
+            visited[ny * cells_x + nx] = 1
+            self.open(x, y, nx, ny)
+            stack.append((nx, ny))
+
+    def cell_tile(self, cell_x, cell_y):
+        """Top-left tile of a cell."""
+        return cell_x * self.pitch + 1, cell_y * self.pitch + 1
+
+    def open(self, x, y, nx, ny):
+        """Clear cell (nx, ny) and the wall between it and the next-door cell (x, y)."""
+        left, top = self.cell_tile(min(x, nx), min(y, ny))
+        right, bottom = self.cell_tile(max(x, nx), max(y, ny))
+        right += MAZE_CORRIDOR
+        bottom += MAZE_CORRIDOR
+        columns, solid = self.grid.columns, self.grid.solid
+        for row in range(top, bottom):
+            solid[row * columns + left:row * columns + right] = bytes(right - left)
+
+    def random_tile(self, reach):
+        """A random corridor tile within reach cells of the start, but not next to it."""
+        last_x, last_y = min(reach, self.cells_x - 1), min(reach, self.cells_y - 1)
+        column, row = self.cell_tile(rng.randint(min(2, last_x), last_x), rng.randint(0, last_y))
+        return column + rng.randrange(MAZE_CORRIDOR), row + rng.randrange(MAZE_CORRIDOR)
+
 class Enemy(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
@@ -768,23 +2670,43 @@ class Enemy(pygame.sprite.Sprite):
         self.image.fill(RED)  # Enemies are red
         self.rect = self.image.get_rect(topleft=(x, y))
         self.speed = 2  # Enemy movement speed
-        self.direction = pygame.math.Vector2(random.choice([-1, 1]), random.choice([-1, 1]))
+        self.direction = pygame.math.Vector2(rng.choice([-1, 1]), rng.choice([-1, 1]))
+
+    def update(self, walls, flow=None):
+        if flow is not None:
+            self.chase(flow)
+            return
 
-    def update(self, walls):
         # Move the enemy
         self.rect.x += self.speed * self.direction.x
         self.rect.y += self.speed * self.direction.y
 
         # Reverse direction if colliding with walls
-        if pygame.sprite.spritecollide(self, walls, False):
+        if hits_wall(self, walls):
             self.rect.x -= self.speed * self.direction.x
             self.rect.y -= self.speed * self.direction.y
             self.direction.x *= -1
             self.direction.y *= -1
 
         # Randomly change direction occasionally
-        if random.randint(0, 100) < 5:  # 5% chance to change direction
-            self.direction = pygame.math.Vector2(random.choice([-1, 1]), random.choice([-1, 1]))
+        if rng.randint(0, 100) < 5:  # 5% chance to change direction
+            self.direction = pygame.math.Vector2(rng.choice([-1, 1]), rng.choice([-1, 1]))
+
+    def chase(self, flow):
+        """Follow a FlowField, only picking a new direction when lined up with a tile."""
+        size = flow.grid.tile_size
+        if self.rect.x % size == 0 and self.rect.y % size == 0:
+            self.direction.update(flow.step(self.rect.x // size, self.rect.y // size))
+        self.rect.x += self.speed * self.direction.x
+        self.rect.y += self.speed * self.direction.y
+
+# Sprite classes that have an array-backed counterpart for big groups, made from a capacity
+SWARMS = {
+    Obstacle: ObstacleSwarm,
+    Enemy: EnemySwarm,
+    DataPoint: functools.partial(FallerSwarm, DataPoint),
+    Glitch: functools.partial(FallerSwarm, Glitch),
+}
 
 
 
@@ -815,101 +2737,157 @@ def level4(player):
         "WWWWWWWWWWWWWWWWWWWW",
     ]
 
-    # Create maze walls
-    walls = pygame.sprite.Group()
-    for y, row in enumerate(maze_layout):
-        for x, cell in enumerate(row):
-            if cell == "W":
-                walls.add(Wall(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
-
-    # Define 7-Eleven location
-    seven_eleven = pygame.Rect(15 * TILE_SIZE, 7 * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-
-    # Create enemies
-    enemies = pygame.sprite.Group()
-    for _ in range(5):  # Add 5 enemies to increase difficulty
-        enemy_x = random.randint(1, GRID_WIDTH - 2) * TILE_SIZE  # Random position within maze bounds
-        enemy_y = random.randint(1, GRID_HEIGHT - 2) * TILE_SIZE
-        if maze_layout[enemy_y // TILE_SIZE][enemy_x // TILE_SIZE] != "W":  # Ensure enemy is not inside a wall
-            enemies.add(Enemy(enemy_x, enemy_y))
-
-    # Set player position at the far left of the screen
-    player.rect.x = TILE_SIZE  # Always start at the far-left edge
-    player.rect.y = random.randint(1, GRID_HEIGHT - 2) * TILE_SIZE  # Random vertical position
-    while pygame.sprite.spritecollide(player, walls, False):
-        player.rect.y += TILE_SIZE  # Adjust downward until in a free space
-        if player.rect.y >= SCREEN_HEIGHT:
-            player.rect.y = TILE_SIZE  # Wrap back to the top
-
+    enemies = entity_group(Enemy, settings["level4_enemies"])
+    times_caught = arrivals = 0  # Only counted in endless mode
+    at_seven_eleven = False
+    camera = tilemap = None
+
+    if settings["level4_maze_size"] is None:
+        # Create maze walls
+        maze = compile_layout(maze_layout, TILE_SIZE)
+        walls = maze.wall_sprites()
+        wall_grid = maze.grid
+        field = FlowField(wall_grid)  # Steps to the player, for spawning and chasing
+
+        # Define 7-Eleven location
+        seven_eleven = pygame.Rect(15 * TILE_SIZE, 7 * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+
+        # Set player position at the far left of the screen
+        player.rect.topleft = maze.random_free_position(1, 1, 1, GRID_HEIGHT - 2)  # Random free tile in the first column
+        field.update(*wall_grid.tile_at(player.rect.center))
+
+        # Create enemies on free tiles within maze bounds, away from the player
+        for _ in range(settings["level4_enemies"]):  # Add 5 enemies to increase difficulty
+            enemies.spawn(*safe_spawn(lambda: maze.random_free_position(1, 1, GRID_WIDTH - 2, GRID_HEIGHT - 2),
+                                      field, settings["level4_safe_distance"]))
+
+        def draw_maze(surface):
+            surface.fill(WHITE)
+            walls.draw(surface)
+            pygame.draw.rect(surface, GREEN, seven_eleven)  # Highlight 7-Eleven in green
+
+        renderer.start_scene(static_layer("level4", (tuple(maze_layout), tuple(seven_eleven)), draw_maze))
+    else:
+        # Generated maze bigger than the screen, with the 7-Eleven in the far corner
+        maze = Maze(*settings["level4_maze_size"], TILE_SIZE)
+        wall_grid = maze.grid
+        radius = settings["level4_flow_radius"]
+        field = FlowField(wall_grid, radius)
+        seven_eleven = pygame.Rect(maze.goal[0] * TILE_SIZE, maze.goal[1] * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        player.rect.topleft = (maze.start[0] * TILE_SIZE, maze.start[1] * TILE_SIZE)
+        field.update(*wall_grid.tile_at(player.rect.center))
+        reach = max(radius // (MAZE_CORRIDOR + 1), 2)  # Enemies start close enough to come looking
+
+        def pick():
+            column, row = maze.random_tile(reach)
+            return column * TILE_SIZE, row * TILE_SIZE
+
+        for _ in range(settings["level4_enemies"]):
+            enemies.spawn(*safe_spawn(pick, field, settings["level4_safe_distance"]))
+
+        tilemap = TileMap(wall_grid, {maze.goal: GREEN})
+        camera = Camera(wall_grid.columns * TILE_SIZE, wall_grid.rows * TILE_SIZE)
+        renderer.start_scene(WHITE, camera)
+
+    flow = field if settings["level4_chase"] else None  # Chasing enemies head for the player
+    stepper = FixedStep(player, enemies)
+    start_level(player=player, enemies=enemies, walls=wall_grid, seven_eleven=seven_eleven)
     running = True
 
     while running:
-        screen.fill(WHITE)
+        frame_timer.begin_frame()
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
-        for event in pygame.event.get():
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+        frame_timer.mark("events")
 
-        keys = pygame.key.get_pressed()
-
-        # Check for movement input and move the player
-        dx, dy = 0, 0
-        if keys[pygame.K_a]:
-            dx = -player.speed
-        if keys[pygame.K_d]:
-            dx = player.speed
-        if keys[pygame.K_w]:
-            dy = -player.speed
-        if keys[pygame.K_s]:
-            dy = player.speed
-
-        player.move(dx, dy, walls)
-
-        # Update enemies
-        enemies.update(walls)
-
-        # Check if the player touches an enemy
-        if pygame.sprite.spritecollide(player, enemies, False):
-            draw_label("You were caught by an enemy!", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=36, color=RED)
-            pygame.display.flip()
-            pygame.time.wait(2000)  # Show message for 2 seconds
-            pygame.mixer.music.stop()
-            return "map"  # Return to map world
-
-        # Check if the player reaches the 7-Eleven
-        if player.rect.colliderect(seven_eleven):
-            show_hot_dog_scene()
-            pygame.mixer.music.stop()
-            return "map"
-
-        # Draw everything
-        walls.draw(screen)
-        enemies.draw(screen)
-        pygame.draw.rect(screen, GREEN, seven_eleven)  # Highlight 7-Eleven in green
-        screen.blit(player.image, player.rect)
-
-        pygame.display.flip()
-        clock.tick(60)
-
+        keys = controls.get_pressed()
 
+        for _ in stepper.steps():
+            # Check for movement input and move the player
+            dx, dy = 0, 0
+            if keys[pygame.K_a]:
+                dx = -player.speed
+            if keys[pygame.K_d]:
+                dx = player.speed
+            if keys[pygame.K_w]:
+                dy = -player.speed
+            if keys[pygame.K_s]:
+                dy = player.speed
+
+            player.move(dx, dy, wall_grid)
+            frame_timer.mark("player")
+
+            # Update enemies
+            if flow is not None:
+                flow.update(*wall_grid.tile_at(player.rect.center))
+            enemies.update(wall_grid, flow)
+            frame_timer.mark("groups")
+
+            # Check if the player touches an enemy
+            if enemies.collide_rect(player.rect):
+                if settings["endless"]:
+                    times_caught += 1
+                    frame_timer.mark("collisions")
+                    continue
+                draw_label("You were caught by an enemy!", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=36, color=RED)
+                pygame.display.flip()
+                clock.delay(2000)  # Show message for 2 seconds
+                end_level("loss", "caught by an enemy", stepper)
+                stop_music()
+                return "map"  # Return to map world
+
+            # Check if the player reaches the 7-Eleven
+            reached = player.rect.colliderect(seven_eleven)
+            if reached and settings["endless"]:
+                if not at_seven_eleven:
+                    arrivals += 1  # Count each visit once, not every step spent there
+            elif reached:
+                end_level("win", "reached the 7-Eleven", stepper)
+                show_hot_dog_scene()
+                stop_music()
+                return "map"
+            at_seven_eleven = reached
+            frame_timer.mark("collisions")
+
+        # Draw everything (walls and the 7-Eleven are in the static layer or the tilemap)
+        if camera is not None:
+            x, y = renderer.world_position(player)
+            camera.follow((x + player.rect.width // 2, y + player.rect.height // 2))
+            for image, position in tilemap.visible(camera.view):
+                renderer.blit(image, position)
+        renderer.draw(enemies)
+        renderer.draw_sprite(player)
+        if settings["endless"]:
+            renderer.label(f"Caught: {times_caught}  7-Eleven: {arrivals}  Enemies: {len(enemies)}", (SCREEN_WIDTH // 2, 20), font_size=24, color=WHITE)
+
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(clock.tick(RENDER_FPS))
+
+
+@profiled
 def show_hot_dog_scene():
     screen.fill(WHITE)
 
     # Load hot dog image or draw scene
-    hot_dog_image = pygame.image.load("images/hot_dog.jpg")  # Replace with your image path
-    hot_dog_image = pygame.transform.scale(hot_dog_image, (200, 200))
+    hot_dog_image = load_image(HOT_DOG_IMAGE, (200, 200))
     screen.blit(hot_dog_image, (SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2 - 100))
 
     # Draw label
     draw_label("Enjoy your hot dog!", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 50), font_size=36, color=RED)
 
     pygame.display.flip()
-    pygame.time.wait(2000)  # Display scene for 2 seconds
+    clock.delay(2000)  # Display scene for 2 seconds
 
+@profiled
 def display_level5_intro():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 28)
     story_lines = [
         "As a child, I feared Spontaneous Human Combustion (SHC)...",
         "Flames bursting from nowhere, consuming loved ones.",
@@ -917,32 +2895,25 @@ def display_level5_intro():
         "Use your water pistol to extinguish the flames.",
         "If the flames grow too large, it's game over!"
     ]
+    button_rect = pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 100, 200, 50)  # Button dimensions
 
-    # Draw the story text
-    y_offset = 100
-    for line in story_lines:
-        text = font.render(line, True, BLACK)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-        y_offset += 40
+    def draw():
+        screen.fill(WHITE)
+        # Draw the story text
+        draw_intro_lines(story_lines, font_size=28, y_offset=100)
 
-    # Draw the button using draw_label
-    button_rect = pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 100, 200, 50)  # Button dimensions
-    pygame.draw.rect(screen, BLACK, button_rect)  # Button border
-    pygame.draw.rect(screen, WHITE, button_rect.inflate(-4, -4))  # Button fill
-    draw_label("Start Level 5", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 75), font_size=28, color=BLACK)
+        # Draw the button using draw_label
+        pygame.draw.rect(screen, BLACK, button_rect)  # Button border
+        pygame.draw.rect(screen, WHITE, button_rect.inflate(-4, -4))  # Button fill
+        draw_label("Start Level 5", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 75), font_size=28, color=BLACK)
 
-    pygame.display.flip()
+    def handle_event(event):
+        if event.type == pygame.MOUSEBUTTONDOWN and button_rect.collidepoint(event.pos):  # Check if the button is clicked
+            return True
+        return None
 
     # Wait for button click
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if button_rect.collidepoint(event.pos):  # Check if the button is clicked
-                    waiting = False
+    wait_for_scene(draw, handle_event)
 
 
 
@@ -953,207 +2924,238 @@ def level5(player):
 
     # Set up sprites
     flames = pygame.sprite.Group()
-    water_shots = pygame.sprite.Group()
+    water_shots = projectile_group(Water)
 
     # Create a central flame
     flame = Flame(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2)
     flames.add(flame)
 
+    renderer.start_scene(WHITE)
+    stepper = FixedStep(player, flames, water_shots)
+    start_level(player=player, flame=flame, water_shots=water_shots)
     running = True
 
     while running:
-        screen.fill(WHITE)
+        frame_timer.begin_frame()
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
-        for event in pygame.event.get():
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
 
             # Player shoots water with mouse click
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:  # Left click
-                direction = pygame.math.Vector2(pygame.mouse.get_pos()) - player.rect.center
+                direction = pygame.math.Vector2(controls.get_mouse_pos()) - player.rect.center
                 if direction.length() > 0:
                     direction = direction.normalize()
-                    water = Water(player.rect.center, direction)
-                    water_shots.add(water)
+                    water_shots.fire(player.rect.center, direction)
+        frame_timer.mark("events")
 
         # Movement (WASD or arrow keys)
-        keys = pygame.key.get_pressed()
-        dx, dy = 0, 0
-        if keys[pygame.K_a]:
-            dx = -player.speed
-        if keys[pygame.K_d]:
-            dx = player.speed
-        if keys[pygame.K_w]:
-            dy = -player.speed
-        if keys[pygame.K_s]:
-            dy = player.speed
-        player.move(dx, dy, pygame.sprite.Group())  # No walls in this level
-
-        # Update water shots
-        water_shots.update()
-
-        # Check collisions: water hits flames
-        for water in pygame.sprite.spritecollide(flame, water_shots, True):
-            flame.shrink()
-
-        # Flame grows over time
-        flame.grow()
-
-        # Check win condition
-        if flame.size <= 20:
-            draw_label("You extinguished the flames! Level Complete.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-            pygame.display.flip()
-            pygame.time.delay(2000)
-            pygame.mixer.music.stop()
-            return "map"
+        keys = controls.get_pressed()
 
-        # Check fail condition
-        if flame.size >= 300:
-            draw_label("The flames got too big! Returning to map.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), color=RED)
-            pygame.display.flip()
-            pygame.time.delay(2000)
-            pygame.mixer.music.stop()
-            return "map"
+        for _ in stepper.steps():
+            dx, dy = 0, 0
+            if keys[pygame.K_a]:
+                dx = -player.speed
+            if keys[pygame.K_d]:
+                dx = player.speed
+            if keys[pygame.K_w]:
+                dy = -player.speed
+            if keys[pygame.K_s]:
+                dy = player.speed
+            player.move(dx, dy, pygame.sprite.Group())  # No walls in this level
+            frame_timer.mark("player")
+
+            # Update water shots
+            water_shots.update()
+            frame_timer.mark("groups")
+
+            # Check collisions: water hits flames
+            for _ in range(water_shots.remove_overlapping(flame.rect)):
+                flame.shrink()
+            frame_timer.mark("collisions")
+
+            # Flame grows over time
+            flame.grow()
+
+            # Check win condition
+            if flame.size <= 20:
+                draw_label("You extinguished the flames! Level Complete.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
+                pygame.display.flip()
+                clock.delay(2000)
+                end_level("win", "flames extinguished", stepper)
+                stop_music()
+                return "map"
+
+            # Check fail condition
+            if flame.size >= FLAME_MAX_SIZE:
+                draw_label("The flames got too big! Returning to map.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), color=RED)
+                pygame.display.flip()
+                clock.delay(2000)
+                end_level("loss", "flames too big", stepper)
+                stop_music()
+                return "map"
+            frame_timer.mark("groups")
 
         # Draw everything
-        flames.draw(screen)
-        water_shots.draw(screen)
-        screen.blit(player.image, player.rect)
+        renderer.draw(flames)
+        renderer.draw(water_shots)
+        renderer.draw_sprite(player)
 
-        pygame.display.flip()
-        clock.tick(60)
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(clock.tick(RENDER_FPS))
 
 def level6(player):
     display_level6_intro()  # Show intro
     play_music("level6")  # Play level-specific music
 
     TILE_SIZE = 40
-    WIN_THRESHOLD = 50  # Data points required to win
+    WIN_THRESHOLD = settings["level6_win_threshold"]  # Data points required to win
     INITIAL_SPEED = 3
-    MAX_OBSTACLES = 10
-    MAX_DATA_POINTS = 15
+    MAX_OBSTACLES = settings["level6_max_glitches"]
+    MAX_DATA_POINTS = settings["level6_max_data_points"]
 
     # Create groups for data points and obstacles
-    data_points = pygame.sprite.Group()
-    obstacles = pygame.sprite.Group()
+    data_points = entity_group(DataPoint, MAX_DATA_POINTS)
+    obstacles = entity_group(Glitch, MAX_OBSTACLES)
 
     # Player stats
     collected_data = 0
     missed_data = 0
-    max_missed = 5  # Maximum missed data points before failure
+    glitch_hits = 0  # Only counted in endless mode
+    max_missed = settings["level6_max_missed"]  # Maximum missed data points before failure
 
     # Game difficulty modifiers
-    spawn_rate = 1000  # Spawn every 1000ms initially
-    last_spawn_time = pygame.time.get_ticks()
+    spawn_rate = settings["level6_spawn_rate"]  # Spawn every 1000ms initially
+    last_spawn_time = 0
 
-    running = True
-
-    while running:
-        screen.fill((10, 10, 20))  # Retro dark blue background
+    def draw_grid(surface):
+        surface.fill((10, 10, 20))  # Retro dark blue background
 
         # Pulsing grid effect
         for x in range(0, SCREEN_WIDTH, TILE_SIZE):
-            pygame.draw.line(screen, (30, 30, 60), (x, 0), (x, SCREEN_HEIGHT))
+            pygame.draw.line(surface, (30, 30, 60), (x, 0), (x, SCREEN_HEIGHT))
         for y in range(0, SCREEN_HEIGHT, TILE_SIZE):
-            pygame.draw.line(screen, (30, 30, 60), (0, y), (SCREEN_WIDTH, y))
+            pygame.draw.line(surface, (30, 30, 60), (0, y), (SCREEN_WIDTH, y))
+
+    renderer.start_scene(static_layer("level6", TILE_SIZE, draw_grid))
+    stepper = FixedStep(player, data_points, obstacles)
+    start_level(player=player, data_points=data_points, glitches=obstacles)
+    running = True
+
+    while running:
+        frame_timer.begin_frame()
+        renderer.begin()
+        frame_timer.mark("draw")  # Clearing the screen
 
         # Handle events
-        for event in pygame.event.get():
+        for event in controls.events():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
+        frame_timer.mark("events")
 
         # Player movement (WASD)
-        keys = pygame.key.get_pressed()
-        dx, dy = 0, 0
-        if keys[pygame.K_a]:
-            dx = -player.speed
-        if keys[pygame.K_d]:
-            dx = player.speed
-        player.rect.x += dx
-        player.rect.x = max(50, min(player.rect.x, SCREEN_WIDTH - 50))  # Keep player on-screen
-
-        # Spawn new objects over time
-        current_time = pygame.time.get_ticks()
-        if current_time - last_spawn_time > spawn_rate:
-            # Spawn a data point
-            if len(data_points) < MAX_DATA_POINTS:
-                data = pygame.sprite.Sprite()
-                data.image = pygame.Surface((20, 20), pygame.SRCALPHA)
-                pygame.draw.circle(data.image, (0, 255, 255), (10, 10), 10)  # Cyan glowing data
-                data.rect = data.image.get_rect(center=(random.randint(100, SCREEN_WIDTH - 100), -TILE_SIZE))
-                data.velocity = INITIAL_SPEED + (collected_data // 10)  # Increase speed gradually
-                data_points.add(data)
-
-            # Spawn an obstacle
-            if len(obstacles) < MAX_OBSTACLES:
-                obstacle = pygame.sprite.Sprite()
-                obstacle.image = pygame.Surface((30, 30))
-                obstacle.image.fill((255, 0, 0))  # Red for glitches
-                obstacle.rect = obstacle.image.get_rect(center=(random.randint(100, SCREEN_WIDTH - 100), -TILE_SIZE))
-                obstacle.velocity = INITIAL_SPEED + (collected_data // 10)  # Increase speed gradually
-                obstacles.add(obstacle)
-
-            last_spawn_time = current_time
-
-        # Update data points
-        for data in data_points:
-            data.rect.y += data.velocity
-            if data.rect.top > SCREEN_HEIGHT:  # Missed data point
-                data.kill()
-                missed_data += 1
-            if data.rect.colliderect(player.rect):  # Collect data
-                data.kill()
+        keys = controls.get_pressed()
+
+        for _ in stepper.steps():
+            dx = 0
+            if keys[pygame.K_a]:
+                dx = -player.speed
+            if keys[pygame.K_d]:
+                dx = player.speed
+            player.rect.x += dx
+            player.rect.x = max(50, min(player.rect.x, SCREEN_WIDTH - 50))  # Keep player on-screen
+            frame_timer.mark("player")
+
+            # Spawn new objects over time (on the simulation clock)
+            current_time = stepper.time
+            if current_time - last_spawn_time > spawn_rate:
+                velocity = INITIAL_SPEED
+                if not settings["endless"]:
+                    velocity += collected_data // 10  # Increase speed gradually
+                for _ in range(settings["level6_spawn_batch"]):
+                    # Spawn a data point
+                    if len(data_points) < MAX_DATA_POINTS:
+                        data_points.spawn((rng.randint(100, SCREEN_WIDTH - 100), -TILE_SIZE), velocity)
+
+                    # Spawn an obstacle
+                    if len(obstacles) < MAX_OBSTACLES:
+                        obstacles.spawn((rng.randint(100, SCREEN_WIDTH - 100), -TILE_SIZE), velocity)
+
+                last_spawn_time = current_time
+
+            # Update data points: missed ones fall off the screen, touched ones are collected
+            missed_data += data_points.update()
+            frame_timer.mark("groups")
+            for _ in range(data_points.remove_overlapping(player.rect)):
                 collected_data += 1
                 print("Data collected!")
-
-        # Update obstacles
-        for obstacle in obstacles:
-            obstacle.rect.y += obstacle.velocity
-            if obstacle.rect.top > SCREEN_HEIGHT:  # Remove if off-screen
-                obstacle.kill()
-            if obstacle.rect.colliderect(player.rect):  # Collide with glitch
+            frame_timer.mark("collisions")
+
+            # Update obstacles (they are removed once off-screen)
+            obstacles.update()
+            frame_timer.mark("groups")
+            if settings["endless"]:
+                glitch_hits += obstacles.remove_overlapping(player.rect)
+                frame_timer.mark("collisions")
+                continue
+            if obstacles.collide_rect(player.rect):  # Collide with glitch
                 draw_label("You hit a glitch! Returning to map.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=28, color=RED)
                 pygame.display.flip()
-                pygame.time.delay(2000)
-                pygame.mixer.music.stop()
+                clock.delay(2000)
+                end_level("loss", "hit a glitch", stepper, data=collected_data)
+                stop_music()
                 return "map"
 
-        # Draw everything
-        data_points.draw(screen)
-        obstacles.draw(screen)
-        screen.blit(player.image, player.rect)
+            # Check win condition
+            if collected_data >= WIN_THRESHOLD:
+                draw_label("Level Complete! You collected enough data.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=28, color=RED)
+                pygame.display.flip()
+                clock.delay(2000)
+                end_level("win", "data collected", stepper, data=collected_data)
+                stop_music()
+                return "map"
 
-        # Draw stats
-        draw_label(f"Data Collected: {collected_data}/{WIN_THRESHOLD}", (150, 20), font_size=24)
-        draw_label(f"Missed Data: {missed_data}/{max_missed}", (SCREEN_WIDTH - 150, 20), font_size=24)
+            # Check fail condition
+            if missed_data >= max_missed:
+                draw_label("Too many missed data points! Returning to map.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=28, color=RED)
+                pygame.display.flip()
+                clock.delay(2000)
+                end_level("loss", "missed too much data", stepper, data=collected_data)
+                stop_music()
+                return "map"
+            frame_timer.mark("collisions")
 
-        # Check win condition
-        if collected_data >= WIN_THRESHOLD:
-            draw_label("Level Complete! You collected enough data.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=28, color=RED)
-            pygame.display.flip()
-            pygame.time.delay(2000)
-            pygame.mixer.music.stop()
-            return "map"
+        # Draw everything
+        renderer.draw(data_points)
+        renderer.draw(obstacles)
+        renderer.draw_sprite(player)
 
-        # Check fail condition
-        if missed_data >= max_missed:
-            draw_label("Too many missed data points! Returning to map.", (SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2), font_size=28, color=RED)
-            pygame.display.flip()
-            pygame.time.delay(2000)
-            pygame.mixer.music.stop()
-            return "map"
+        # Draw stats
+        renderer.label(f"Data Collected: {collected_data}/{WIN_THRESHOLD}", (150, 20), font_size=24)
+        renderer.label(f"Missed Data: {missed_data}/{max_missed}", (SCREEN_WIDTH - 150, 20), font_size=24)
+        if settings["endless"]:
+            renderer.label(f"Glitch hits: {glitch_hits}  On screen: {len(data_points) + len(obstacles)}",
+                           (SCREEN_WIDTH // 2, 50), font_size=24)
 
-        pygame.display.flip()
-        clock.tick(60)
+        frame_timer.mark("draw")
+        renderer.present()
+        frame_timer.mark("flip")
+        frame_timer.end_frame()
+        stepper.advance(clock.tick(RENDER_FPS))
 
 
 
 
+@profiled
 def display_level6_intro():
-    screen.fill(WHITE)
-    font = pygame.font.Font(None, 28)
     story_lines = [
         "Lonely nights, staring at a TV screen...",
         "Lost in cyberspace, I call for a 'data date'.",
@@ -1161,51 +3163,156 @@ def display_level6_intro():
         "but beware the roaming glitches and viruses!",
         "Hurry up, the clock is ticking..."
     ]
-
-    y_offset = 100
-    for line in story_lines:
-        text = font.render(line, True, BLACK)
-        screen.blit(text, (SCREEN_WIDTH // 2 - text.get_width() // 2, y_offset))
-        y_offset += 40
-
-    draw_label("Click the button to begin!", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 150))
     button_rect = pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT - 100, 200, 50)
-    pygame.draw.rect(screen, GRAY, button_rect)
-    draw_label("Start", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 75), font_size=28)
 
-    pygame.display.flip()
-
-    waiting = True
-    while waiting:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                sys.exit()
-            if event.type == pygame.MOUSEBUTTONDOWN and button_rect.collidepoint(event.pos):
-                waiting = False
+    def draw():
+        screen.fill(WHITE)
+        draw_intro_lines(story_lines, font_size=28, y_offset=100)
+
+        draw_label("Click the button to begin!", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 150))
+        pygame.draw.rect(screen, GRAY, button_rect)
+        draw_label("Start", (SCREEN_WIDTH // 2, SCREEN_HEIGHT - 75), font_size=28)
+
+    def handle_event(event):
+        if event.type == pygame.MOUSEBUTTONDOWN and button_rect.collidepoint(event.pos):
+            return True
+        return None
+
+    wait_for_scene(draw, handle_event)
+
+
+# Stress variants for the NumPy entity arrays
+def level2_stress(player):
+    """Level 2 with 10,000 bouncing obstacles that only count hits."""
+    with overridden_settings(level2_obstacles=10000, endless=True):
+        return level2(player)
+
+def level4_maze(player):
+    """Level 4 in a generated 120x90-tile maze that scrolls with the player."""
+    with overridden_settings(level4_maze_size=(120, 90)):
+        return level4(player)
+
+def level4_huge(player):
+    """Level 4 in a generated 1000x1000-tile maze."""
+    with overridden_settings(level4_maze_size=(1000, 1000)):
+        return level4(player)
+
+def level6_endless(player):
+    """Level 6 that never ends, with over 10,000 data points and glitches falling at once."""
+    with overridden_settings(level6_max_data_points=2000, level6_max_glitches=10000,
+                             level6_spawn_rate=0, level6_spawn_batch=50, endless=True):
+        return level6(player)
+
+LEVELS = {
+    "map": map_world,
+    "level1": level1,
+    "level2": level2,
+    "level3": level3,
+    "level4": level4,
+    "level5": level5,
+    "level6": level6,
+    "level2-stress": level2_stress,
+    "level4-maze": level4_maze,
+    "level4-huge": level4_huge,
+    "level6-endless": level6_endless,
+}
 
+def seed_level(seed, level):
+    """Seed the level random source so a given (seed, level) always plays out the same."""
+    rng.seed(f"{seed}:{level}")
+
+def run_level(name, player):
+    """Run a scene from LEVELS, profiled when profiling is on, and return the name of the next one."""
+    frame_timer.scene = name
+    with profiled_scene(name):
+        return LEVELS[name](player)
+
+def simulate(level, seed, player_name="Daniel", max_frames=None):
+    """Run a single level with a fixed seed and return (result, frames, virtual milliseconds).
+
+    Meant for headless mode, where frames are not capped to real time. The
+    result is the level's return value, or "timeout" if it was still running
+    after max_frames frames.
+    """
+    init_display()
+    seed_level(seed, level)
+    player = Player(player_name)
+    clock.reset(max_frames)
+    try:
+        result = run_level(level, player)
+    except SimulationLimit:
+        result = "timeout"
+    finally:
+        clock.frame_limit = None
+    return result, clock.frames, clock.get_ticks()
 
 # Main game loop
-player_name = welcome_screen()
-player = Player(player_name)
-current_level = "map"
-
-while True:
-    if current_level == "map":
-        current_level = map_world(player)
-    elif current_level == "level1":
-        current_level = level1(player)
-    elif current_level == "level2":
-        current_level = level2(player)
-    elif current_level == "level3":
-        current_level = level3(player)
-    elif current_level == "level4":
-        current_level = level4(player)
-    elif current_level == "level5":
-        current_level = level5(player)
-    elif current_level == "level6":
-        current_level = level6(player)
-
-
-
-
+def main():
+    global profile_mode, profile_dir, controls
+    parser = argparse.ArgumentParser(description="Liquid Rigidity")
+    parser.add_argument("--seed", help="seed the level random source for reproducible runs")
+    parser.add_argument("--levels", nargs="+", default=[f"level{i}" for i in range(1, 7)], choices=list(LEVELS),
+                        help="levels to simulate in headless mode")
+    parser.add_argument("--runs", type=int, default=1, help="seeded runs per level in headless mode")
+    parser.add_argument("--max-frames", type=int, default=60 * 60 * 5, help="frame budget per headless run")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=profile_mode,
+                        help="profile each scene run (same as LRP_PROFILE)")
+    parser.add_argument("--profile-dir", default=profile_dir, help="where profiles are written (LRP_PROFILE_DIR)")
+    parser.add_argument("--record", metavar="PATH", help="record the session's input to a replay file")
+    parser.add_argument("--replay", metavar="PATH", help="play a recorded session back at uncapped speed")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print import / first window / first frame times and exit (status 1 if over budget)")
+    args = parser.parse_args()
+    profile_mode, profile_dir = args.profile, args.profile_dir
+
+    if args.startup_report:
+        init_display()
+        clock.virtual = True  # Show the first screen without waiting for input
+        welcome_screen()
+        sys.exit(0 if startup_report() else 1)
+
+    if args.replay:
+        controls = ReplayInput(args.replay)
+        clock.virtual = True  # Uncapped, and the intros don't wait for clicks
+        init_display()
+        player = Player(controls.player)
+        current_level = "map"
+        try:
+            while True:
+                seed_level(controls.seed, current_level)
+                current_level = run_level(current_level, player)
+        except SimulationLimit:
+            print(f"Replayed {controls.frame} frames, ending in {current_level}")
+        return
+
+    if HEADLESS:
+        base_seed = int(args.seed or 0)
+        for level in args.levels:
+            for run in range(args.runs):
+                result, frames, ticks = simulate(level, base_seed + run, max_frames=args.max_frames)
+                print(f"{level} seed={base_seed + run} result={result} frames={frames} game_time={ticks / 1000:.1f}s")
+        return
+
+    if args.record:
+        if args.seed is None:
+            args.seed = str(random.getrandbits(32))  # A replay needs the seed
+        controls = InputRecorder(controls, args.record, args.seed)
+
+    init_display()
+    player_name = welcome_screen()
+    if args.record:
+        controls.player = player_name
+    player = Player(player_name)
+    weapon_sounds[player_name]  # Decode the chosen weapon sound before the first shot
+    audio.start()
+    current_level = "map"
+
+    while True:
+        if args.seed is not None and current_level in LEVELS:
+            seed_level(args.seed, current_level)
+        current_level = run_level(current_level, player)
+
+mark_startup("import")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Random music prompts (key, mode, style and image) without the window.
+
+The Tk window in "random music generator.py" shows one prompt per click.
+This module makes them in bulk, for writing sessions:
+
+    python music_prompts.py -n 20                                  # JSONL to stdout
+    python music_prompts.py -n 5000000 --seed 7 --format csv -o prompts.csv
+    python music_prompts.py -n 2160 --no-repeat                    # every key, mode and style once
+
+or from Python:
+
+    from music_prompts import generate_selections
+    for key, mode, style, image in generate_selections(10, seed=7):
+        ...
+
+Selections are drawn in batches and each row is put together from
+strings formatted once per combination and once per image, so writing
+millions of them is bound by the output, not the interpreter.
+"""
+import os
+import sys
+import csv
+import io
+import json
+import random
+import operator
+import argparse
+
+# Images are looked up next to this file, whatever the working directory is
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_FOLDER = os.path.join(SCRIPT_DIR, "images")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp")
+
+KEYS = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+MODES = [
+    "Major", "Minor", "Dorian", "Phrygian", "Lydian", "Mixolydian", "Locrian",
+    "Harmonic Minor", "Melodic Minor", "Pentatonic Major", "Pentatonic Minor", "Blues"
+]
+STYLES = [
+    "Jazz", "Blues", "Rock", "Classical", "Pop", "Funk", "Electronic", "Hip-Hop",
+    "Reggae", "Folk", "Country", "Ambient", "Metal", "Latin", "Soul",
+]
+# Every (key, mode, style) a selection can have
+COMBINATIONS = [(key, mode, style) for key in KEYS for mode in MODES for style in STYLES]
+
+BATCH_SIZE = 65536  # Selections drawn and written at a time
+FIELDS = ["key", "mode", "style", "image"]
+
+class ImageIndex:
+    """The image files in a folder, rescanned only when the folder changes.
+
+    Adding, removing or renaming a file changes the folder's modification
+    time, so a stat per call is enough to notice. Files without an image
+    extension are left out.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.mtime = None
+        self.paths = []
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime = None  # No folder, no images
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.paths = []
+            if mtime is not None:
+                with os.scandir(self.folder) as entries:
+                    self.paths = sorted(
+                        entry.path for entry in entries
+                        if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file()
+                    )
+        return self.paths
+
+    def choice(self, rng=random):
+        paths = self.refresh()
+        return rng.choice(paths) if paths else None
+
+def generate_random_key(rng=random):
+    return f"{rng.choice(KEYS)} {rng.choice(MODES)}"
+
+def generate_random_style(rng=random):
+    return rng.choice(STYLES)
+
+def selection_batches(count, rng, combinations, images, no_repeat=False):
+    """Yield (combinations, images) lists, picked from the given lists, covering count selections.
+
+    combinations and images are COMBINATIONS and the image paths, or text
+    standing in for them: the picks only depend on rng and the lengths, so
+    the same seed picks the same selections either way. With no_repeat
+    every combination is used once, in a shuffled order, before any of
+    them comes up again.
+    """
+    order = []
+    while count > 0:
+        size = min(count, BATCH_SIZE)
+        count -= size
+        if no_repeat:
+            picked = []
+            while len(picked) < size:
+                if not order:
+                    order = list(combinations)
+                    rng.shuffle(order)
+                take = min(size - len(picked), len(order))
+                picked += order[-take:]
+                del order[-take:]
+        else:
+            picked = rng.choices(combinations, k=size)
+        yield picked, rng.choices(images, k=size) if len(images) > 1 else images * size
+
+def generate_selections(count, seed=None, no_repeat=False, images=None):
+    """Yield count selections as (key, mode, style, image path) tuples.
+
+    images is a list of image paths (the images folder by default); the
+    image is None if there are none. The same seed gives the same
+    selections as write_selections.
+    """
+    if images is None:
+        images = ImageIndex(IMAGE_FOLDER).refresh()
+    rng = random.Random(seed)
+    for combinations, picks in selection_batches(count, rng, COMBINATIONS, images or [None], no_repeat):
+        for combination, image in zip(combinations, picks):
+            yield combination + (image,)
+
+def formatted_cells(fmt, images):
+    """Return each combination and each image as text, so rows are just joined."""
+    if fmt == "jsonl":
+        heads = ['{"key": %s, "mode": %s, "style": %s, "image": ' % tuple(json.dumps(value) for value in combination)
+                 for combination in COMBINATIONS]
+        tails = [json.dumps(path) + "}\n" for path in images] or ["null}\n"]
+    else:
+        def row(values):
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerow(values)
+            return buffer.getvalue()
+        heads = [row(combination + ("",))[:-1] for combination in COMBINATIONS]  # Up to the last comma
+        tails = [row([path]) for path in images] or ["\n"]
+    return heads, tails
+
+def write_selections(out, count, fmt="jsonl", seed=None, no_repeat=False, images=None):
+    """Write count selections to a text file as JSON lines or CSV."""
+    if images is None:
+        images = ImageIndex(IMAGE_FOLDER).refresh()
+    heads, tails = formatted_cells(fmt, images)
+    if fmt == "csv":
+        out.write(",".join(FIELDS) + "\n")
+    rng = random.Random(seed)
+    for rows in selection_batches(count, rng, heads, tails, no_repeat):
+        out.write("".join(map(operator.add, *rows)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Write random music prompts without opening the window")
+    parser.add_argument("-n", "--count", type=int, default=1, help="number of selections")
+    parser.add_argument("--seed", type=int, help="random seed, for a repeatable list")
+    parser.add_argument("--no-repeat", action="store_true",
+                        help=f"use all {len(COMBINATIONS)} key/mode/style combinations before repeating one")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("-o", "--output", metavar="PATH", help="write to a file instead of stdout")
+    parser.add_argument("--images", metavar="DIR", default=IMAGE_FOLDER, help="folder to pick images from")
+    args = parser.parse_args()
+
+    images = ImageIndex(args.images).refresh()
+    if args.output:
+        with open(args.output, "w", newline="", encoding="utf-8", buffering=1 << 20) as out:
+            write_selections(out, args.count, args.format, args.seed, args.no_repeat, images)
+    else:
+        try:
+            write_selections(sys.stdout, args.count, args.format, args.seed, args.no_repeat, images)
+        except BrokenPipeError:
+            sys.stderr.close()  # Piped into head: stop quietly
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,69 @@
-import random
 import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 import os
+import hashlib
+from collections import OrderedDict
 
-def generate_random_key():
-    keys = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
-    modes = [
-        "Major", "Minor", "Dorian", "Phrygian", "Lydian", "Mixolydian", "Locrian", 
-        "Harmonic Minor", "Melodic Minor", "Pentatonic Major", "Pentatonic Minor", "Blues"
-    ]
-    
-    random_key = random.choice(keys)
-    random_mode = random.choice(modes)
-    
-    return f"{random_key} {random_mode}"
-
-def generate_random_style():
-    styles = [
-        "Jazz",
-        "Blues",
-        "Rock",
-        "Classical",
-        "Pop",
-        "Funk",
-        "Electronic",
-        "Hip-Hop",
-        "Reggae",
-        "Folk",
-        "Country",
-        "Ambient",
-        "Metal",
-        "Latin",
-        "Soul",
-    ]
-    
-    return random.choice(styles)
+# Keys, styles and the image index are shared with the command line version
+from music_prompts import SCRIPT_DIR, IMAGE_FOLDER, ImageIndex, generate_random_key, generate_random_style
+
+THUMBNAIL_SIZE = (200, 200)
+THUMBNAIL_MEMORY = 64  # Thumbnails kept in memory, least recently shown dropped first
+THUMBNAIL_CACHE_DIR = os.path.join(SCRIPT_DIR, ".cache", "thumbnails")
+
+class ThumbnailCache:
+    """Resized images, kept in memory and on disk.
+
+    Thumbnails are keyed by path, modification time and size, so an edited
+    image is resized again. The last THUMBNAIL_MEMORY are kept in memory;
+    every thumbnail is also saved as a PNG under cache_dir, so a restart
+    doesn't need to decode the full-size images again.
+    """
+
+    def __init__(self, size, capacity, cache_dir):
+        self.size = size
+        self.capacity = capacity
+        self.cache_dir = cache_dir
+        self.memory = OrderedDict()
+
+    def get(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        image = self.memory.get(key)
+        if image is not None:
+            self.memory.move_to_end(key)
+            return image
+
+        name = hashlib.sha1(repr((key, self.size)).encode()).hexdigest() + ".png"
+        cached = os.path.join(self.cache_dir, name)
+        try:
+            with Image.open(cached) as thumbnail:
+                image = thumbnail.copy()
+        except OSError:
+            image = self.resize(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp = f"{cached}.{os.getpid()}.tmp"
+            image.save(temp, "PNG")
+            os.replace(temp, cached)  # Never leave a half-written thumbnail behind
+
+        self.memory[key] = image
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+        return image
+
+    def resize(self, path):
+        with Image.open(path) as img:
+            img.draft("RGB", self.size)  # Let JPEGs decode at a reduced scale
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            return img.resize(self.size, Image.LANCZOS)
+
+image_index = ImageIndex(IMAGE_FOLDER)
+thumbnails = ThumbnailCache(THUMBNAIL_SIZE, THUMBNAIL_MEMORY, THUMBNAIL_CACHE_DIR)
 
 def get_random_image():
-    image_folder = "images"  # Folder containing images
-    images = os.listdir(image_folder)
-    random_image = random.choice(images)
-    return os.path.join(image_folder, random_image)
+    return image_index.choice()
 
 def display_random_selection():
     key = generate_random_key()
@@ -49,9 +71,14 @@ def display_random_selection():
 
     # Get a random image
     image_path = get_random_image()
-    img = Image.open(image_path)
-    img = img.resize((200, 200), Image.LANCZOS)  # Updated to use LANCZOS
-    img = ImageTk.PhotoImage(img)
+    if image_path is None:
+        messagebox.showwarning("Random Music Generator", f"No images found in {IMAGE_FOLDER}")
+        return
+    try:
+        img = ImageTk.PhotoImage(thumbnails.get(image_path))
+    except OSError:
+        messagebox.showwarning("Random Music Generator", f"Could not open {image_path}")
+        return
 
     # Create a new window to display results
     result_window = tk.Toplevel()